@@ -6,7 +6,20 @@ class Settings(BaseSettings):
     S2S_MODEL: str = "gpt-4o-realtime-preview"
     S2S_VOICE: str = "alloy"
     CHAT_MODEL: str = "gpt-4o"
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
     DATABASE_URL: str
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 20
+    # "off" lets commits return before the WAL flush; a crash can lose the last
+    # few hundred ms of commits but never corrupts data. Opt in only where that's
+    # acceptable (tests, seed data).
+    DB_SYNCHRONOUS_COMMIT: str = "on"
+    # Whether DATABASE_URL goes through PgBouncer/Supavisor, which don't pass
+    # per-connection startup settings on. None = guess from the URL.
+    DB_BEHIND_POOLER: bool | None = None
+    # Fail a statement after waiting this long for a row/table lock instead of
+    # hanging; it raises asyncpg.exceptions.LockNotAvailableError
+    DB_LOCK_TIMEOUT_MS: int = 5000
 
     # Query limits
     CONVERSATION_HISTORY_LIMIT: int = 5
@@ -20,6 +33,12 @@ class Settings(BaseSettings):
     MAX_PATTERNS_FOR_REVIEW: int = 3
     MAX_EXAMPLES_FOR_REVIEW: int = 3
 
+    # Correction cache: reuse an earlier answer on the same segment above this cosine similarity
+    CORRECTION_CACHE_THRESHOLD: float = 0.92
+
+    # Exact-match cache for transcript-only LLM calls (chat summary, review marks)
+    LLM_CACHE_TTL_SECONDS: int = 86400
+
     model_config = {"env_file": ".env", "extra": "ignore"}
 
 
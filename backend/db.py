@@ -1,4 +1,5 @@
 import re
+from urllib.parse import urlsplit
 
 import asyncpg
 
@@ -47,6 +48,21 @@ SCHEMA_STATEMENTS = [
         created_at      TEXT NOT NULL
     )""",
     """\
+    CREATE TABLE IF NOT EXISTS correction_cache (
+        id          SERIAL PRIMARY KEY,
+        segment_id  INTEGER NOT NULL REFERENCES segments(id),
+        embedding   BYTEA NOT NULL,
+        correction  TEXT NOT NULL,
+        explanation TEXT NOT NULL,
+        created_at  TEXT NOT NULL
+    )""",
+    """\
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key        TEXT PRIMARY KEY,
+        response   TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""",
+    """\
     CREATE TABLE IF NOT EXISTS user_profiles (
         user_id      TEXT PRIMARY KEY,
         user_name    TEXT,
@@ -81,6 +97,17 @@ SCHEMA_STATEMENTS = [
     )""",
 ]
 
+INDEX_STATEMENTS = [
+    # Marks are looked up by session via `segment_id IN (SELECT id FROM segments ...)`;
+    # segments(session_id, ...) is already covered by its UNIQUE constraint.
+    "CREATE INDEX IF NOT EXISTS idx_ai_marks_segment_id ON ai_marks (segment_id)",
+    "CREATE INDEX IF NOT EXISTS idx_correction_cache_segment_id ON correction_cache (segment_id)",
+    "CREATE INDEX IF NOT EXISTS idx_corrections_session_id ON corrections (session_id)",
+    # Per-user history lookups (chat/review history, quick review) walk a user's
+    # sessions newest first.
+    "CREATE INDEX IF NOT EXISTS idx_sessions_user_started ON sessions (user_id, started_at DESC)",
+]
+
 
 def _convert_placeholders(sql: str) -> str:
     """Convert SQLite-style ? placeholders to PostgreSQL $1, $2, ... style."""
@@ -115,6 +142,13 @@ class Database:
         await self._pool.execute(converted, *params)
         return None
 
+    async def executemany(self, sql: str, params_seq: list[tuple]) -> None:
+        """Execute a statement once per params tuple in a single batched round-trip."""
+        if not params_seq:
+            return
+        converted = _convert_placeholders(sql)
+        await self._pool.executemany(converted, params_seq)
+
     async def commit(self) -> None:
         """No-op: asyncpg auto-commits each statement."""
         pass
@@ -123,9 +157,41 @@ class Database:
 _db: Database | None = None
 
 
+def _behind_pooler(dsn: str) -> bool:
+    """Whether dsn points at a connection pooler (Supabase's is *.pooler.supabase.com / port 6543)."""
+    if settings.DB_BEHIND_POOLER is not None:
+        return settings.DB_BEHIND_POOLER
+    parts = urlsplit(dsn)
+    return parts.port == 6543 or "pooler" in (parts.hostname or "")
+
+
+def _server_settings(dsn: str) -> dict[str, str]:
+    """Per-connection settings, sent as startup parameters rather than SET so
+    they survive the RESET ALL the pool issues when a connection is released.
+
+    A pooler rejects or ignores startup parameters and hands each transaction
+    to whichever server connection is free, so behind one these are left to
+    the database role (ALTER ROLE ... SET).
+
+    With lock_timeout set, a statement that waits too long for a lock raises
+    asyncpg.exceptions.LockNotAvailableError instead of blocking.
+    """
+    if _behind_pooler(dsn):
+        return {}
+    return {
+        "synchronous_commit": settings.DB_SYNCHRONOUS_COMMIT,
+        "lock_timeout": str(settings.DB_LOCK_TIMEOUT_MS),
+    }
+
+
 async def init_db() -> None:
     global _pool, _db
-    _pool = await asyncpg.create_pool(dsn=settings.DATABASE_URL)
+    _pool = await asyncpg.create_pool(
+        dsn=settings.DATABASE_URL,
+        min_size=settings.DB_POOL_MIN_SIZE,
+        max_size=settings.DB_POOL_MAX_SIZE,
+        server_settings=_server_settings(settings.DATABASE_URL),
+    )
     _db = Database(_pool)
     async with _pool.acquire() as conn:
         for stmt in SCHEMA_STATEMENTS:
@@ -136,6 +202,8 @@ async def init_db() -> None:
         await conn.execute(
             "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS user_name TEXT"
         )
+        for stmt in INDEX_STATEMENTS:
+            await conn.execute(stmt)
 
 
 async def get_db() -> Database:
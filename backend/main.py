@@ -5,7 +5,7 @@ from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
@@ -13,7 +13,7 @@ import sessions
 from constants import SessionMode, SessionStatus
 from db import init_db, close_db, get_db
 from profile import get_or_create_profile, update_profile_after_session, evaluate_level, generate_progress_notes, generate_quick_review, compute_needs_review, update_learning_goal
-from review import generate_correction, generate_session_review, generate_chat_summary
+from review import generate_correction, generate_session_review, generate_chat_summary, load_transcript
 from topics import get_topics, get_topic_by_id
 
 logging.basicConfig(
@@ -185,14 +185,12 @@ async def get_review(session_id: str):
     )
 
     # Fetch AI marks for these segments
-    seg_ids = [s["id"] for s in segments]
     marks_by_segment: dict[int, list] = {}
-    if seg_ids:
-        placeholders = ",".join("?" * len(seg_ids))
+    if segments:
         marks = await db.execute_fetchall(
-            f"SELECT id, segment_id, issue_types, original, suggestion, explanation "
-            f"FROM ai_marks WHERE segment_id IN ({placeholders})",
-            seg_ids,
+            "SELECT id, segment_id, issue_types, original, suggestion, explanation FROM ai_marks "
+            "WHERE segment_id IN (SELECT id FROM segments WHERE session_id = ?)",
+            (session_id,),
         )
         for m in marks:
             marks_by_segment.setdefault(m["segment_id"], []).append({
@@ -254,6 +252,49 @@ async def get_review(session_id: str):
     }
 
 
+# Longest long-poll wait a client may ask for; out-of-range timeouts get a 422
+MAX_REVIEW_WAIT_SECONDS = 60.0
+_REVIEW_PENDING = (SessionStatus.REVIEWING, SessionStatus.COMPLETING)
+# Once /end has run, REVIEWED is only a stopover: _run_review can still overwrite
+# COMPLETING with it before _finalize_session writes COMPLETED.
+_COMPLETION_PENDING = (SessionStatus.REVIEWING, SessionStatus.REVIEWED, SessionStatus.COMPLETING)
+
+
+@app.get("/sessions/{session_id}/review/wait")
+async def wait_for_review(
+    session_id: str, timeout: float = Query(30.0, ge=0, le=MAX_REVIEW_WAIT_SECONDS)
+):
+    """Long-poll variant of get_review: returns once the session is no longer
+    reviewing/completing (completed, if it was completing), or after `timeout`
+    seconds, whichever comes first."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pending = _REVIEW_PENDING
+    db = await get_db()
+    # Re-read the status after every wake-up until it leaves the awaited states
+    while True:
+        with sessions.watch_status(session_id) as event:
+            rows = await db.execute_fetchall(
+                "SELECT status FROM sessions WHERE id = ?", (session_id,)
+            )
+            if not rows:
+                raise HTTPException(status_code=404, detail="Session not found")
+            status = rows[0]["status"]
+            if status == SessionStatus.COMPLETING:
+                pending = _COMPLETION_PENDING
+            if status not in pending:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    return await get_review(session_id)
+
+
 # -- Correction endpoint --
 
 @app.post("/sessions/{session_id}/corrections")
@@ -333,19 +374,22 @@ async def _finalize_session(session_id: str, user_id: str) -> None:
     try:
         t0 = _time.monotonic()
 
+        # Load the transcript once; session review and chat summary both use it
+        db = await get_db()
+        session_rows, segments = await asyncio.gather(
+            db.execute_fetchall("SELECT topic_id FROM sessions WHERE id = ?", (session_id,)),
+            load_transcript(db, session_id),
+        )
+
         tasks = [
-            generate_session_review(session_id, user_id),
+            generate_session_review(session_id, user_id, rows=segments),
             update_profile_after_session(user_id, session_id),
         ]
 
         # Add chat summary for conversation mode (has topic_id)
-        db = await get_db()
-        rows = await db.execute_fetchall(
-            "SELECT topic_id FROM sessions WHERE id = ?", (session_id,)
-        )
-        topic_id = rows[0]["topic_id"] if rows and rows[0]["topic_id"] else None
+        topic_id = session_rows[0]["topic_id"] if session_rows and session_rows[0]["topic_id"] else None
         if topic_id:
-            tasks.append(generate_chat_summary(session_id, topic_id))
+            tasks.append(generate_chat_summary(session_id, topic_id, rows=segments))
 
         results = await asyncio.gather(*tasks)
         t1 = _time.monotonic()
@@ -370,6 +414,7 @@ async def _finalize_session(session_id: str, user_id: str) -> None:
             log.info("Session %s marked completed", session_id)
         except Exception as e:
             log.error("Failed to mark session %s completed: %s", session_id, e)
+        sessions.notify_status_change(session_id)
 
 
 # -- User profile endpoint --
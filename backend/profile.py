@@ -3,7 +3,7 @@ import logging
 from datetime import datetime, timezone
 
 from config import settings
-from constants import IssueDimension
+from constants import IssueDimension, SessionMode
 from db import get_db
 from providers.openai_chat import chat_json
 
@@ -56,6 +56,30 @@ Return ONLY valid JSON with this exact shape:
 )
 
 
+def _normalize_weak_points(profile_data: dict) -> dict:
+    """Upgrade legacy plain-string weak point patterns to {"pattern", "examples": []}.
+
+    Only that shape is rewritten (plus a missing/null "examples" becoming []);
+    every other value and any extra keys are kept as stored, since
+    update_profile_after_session writes the loaded profile back and anything
+    dropped here would be lost for good.
+    """
+    weak_points = profile_data.get("weak_points")
+    if not isinstance(weak_points, dict):
+        return profile_data
+
+    for dim, patterns in weak_points.items():
+        if not isinstance(patterns, list):
+            continue
+        weak_points[dim] = [
+            {"pattern": p, "examples": []} if isinstance(p, str)
+            else {**p, "examples": p.get("examples") or []} if isinstance(p, dict)
+            else p
+            for p in patterns
+        ]
+    return profile_data
+
+
 async def get_or_create_profile(user_id: str, user_name: str | None = None) -> dict:
     """Get existing profile or create a default one."""
     db = await get_db()
@@ -70,7 +94,7 @@ async def get_or_create_profile(user_id: str, user_name: str | None = None) -> d
             "user_name": row.get("user_name"),
             "level": row["level"],
             "learning_goal": row.get("learning_goal"),
-            "profile_data": json.loads(row["profile_data"]),
+            "profile_data": _normalize_weak_points(json.loads(row["profile_data"])),
             "updated_at": row["updated_at"],
         }
 
@@ -114,15 +138,11 @@ async def update_profile_after_session(user_id: str, session_id: str) -> dict:
         (session_id,),
     )
 
-    seg_ids = [s["id"] for s in segments]
-    marks = []
-    if seg_ids:
-        placeholders = ",".join("?" * len(seg_ids))
-        marks = await db.execute_fetchall(
-            f"SELECT segment_id, issue_types, original, suggestion FROM ai_marks "
-            f"WHERE segment_id IN ({placeholders})",
-            seg_ids,
-        )
+    marks = await db.execute_fetchall(
+        "SELECT segment_id, issue_types, original, suggestion FROM ai_marks "
+        "WHERE segment_id IN (SELECT id FROM segments WHERE session_id = ?)",
+        (session_id,),
+    )
 
     corrections = await db.execute_fetchall(
         "SELECT segment_id, user_message, correction FROM corrections WHERE session_id = ?",
@@ -209,7 +229,7 @@ Input data (JSON):
         input_payload_json=json.dumps(input_payload, ensure_ascii=False, indent=2),
     )
 
-    result = await chat_json(PROFILE_UPDATE_SYSTEM_PROMPT, user_message)
+    result = await chat_json(PROFILE_UPDATE_SYSTEM_PROMPT, user_message, cache_key="profile_update")
 
     # Merge GPT result into existing profile_data, preserving fields GPT doesn't return
     now = datetime.now(timezone.utc).isoformat()
@@ -304,7 +324,7 @@ Current profile: {profile_json}
         summaries_block=summaries_block,
     )
 
-    result = await chat_json(LEVEL_EVAL_SYSTEM_PROMPT, user_message)
+    result = await chat_json(LEVEL_EVAL_SYSTEM_PROMPT, user_message, cache_key="level_eval")
 
     new_level = result.get("level", profile["level"])
     now = datetime.now(timezone.utc).isoformat()
@@ -421,7 +441,7 @@ Current level: {level}
         review_summary_block=review_summary_block,
     )
 
-    result = await chat_json(PROGRESS_NOTES_SYSTEM_PROMPT, user_message)
+    result = await chat_json(PROGRESS_NOTES_SYSTEM_PROMPT, user_message, cache_key="progress_notes")
 
     progress_notes = result.get("progress_notes", "")
 
@@ -489,9 +509,9 @@ async def generate_quick_review(user_id: str) -> dict:
     # Fetch recent conversation session IDs
     recent_sessions = await db.execute_fetchall(
         "SELECT id FROM sessions "
-        "WHERE user_id = ? AND mode = 'conversation' "
-        f"ORDER BY started_at DESC LIMIT {limit}",
-        (user_id,),
+        "WHERE user_id = ? AND mode = ? "
+        f"ORDER BY started_at DESC, id DESC LIMIT {limit}",
+        (user_id, SessionMode.CONVERSATION),
     )
     session_ids = [s["id"] for s in recent_sessions]
 
@@ -576,7 +596,7 @@ Still-struggling patterns from review sessions:
         struggling_block=json.dumps(struggling_patterns, ensure_ascii=False) if struggling_patterns else "  (None)",
     )
 
-    result = await chat_json(QUICK_REVIEW_SYSTEM_PROMPT, user_message)
+    result = await chat_json(QUICK_REVIEW_SYSTEM_PROMPT, user_message, cache_key="quick_review")
 
     quick_review = result.get("quick_review", [])
 
@@ -627,10 +647,9 @@ def compute_needs_review(profile_data: dict) -> bool:
     weak_points = profile_data.get("weak_points", {})
     if not isinstance(weak_points, dict):
         return False
-    for patterns in weak_points.values():
-        if not isinstance(patterns, list):
-            continue
-        for p in patterns:
-            if isinstance(p, dict) and len(p.get("examples", [])) >= 3:
-                return True
-    return False
+    return any(
+        isinstance(p, dict) and len(p.get("examples") or ()) >= 3
+        for patterns in weak_points.values()
+        if isinstance(patterns, list)
+        for p in patterns
+    )
@@ -1,25 +1,61 @@
 import json
 import logging
 
-from openai import AsyncOpenAI
+import httpx
+from openai import NOT_GIVEN, AsyncOpenAI, DefaultAsyncHttpxClient
 
 from config import settings
 
 log = logging.getLogger(__name__)
 
-_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# One client for every chat/embedding call: HTTP/2 lets the concurrent
+# post-session calls multiplex over a single kept-alive connection.
+_client = AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    ),
+)
 
 
-async def chat_json(system_prompt: str, user_message: str) -> dict:
-    """Call GPT-4o with JSON response format and return parsed dict."""
+async def chat_json(
+    system_prompt: str,
+    user_message: str,
+    cache_key: str | None = None,
+    json_schema: dict | None = None,
+) -> dict:
+    """Call GPT-4o with JSON response format and return parsed dict.
+
+    The system prompt is sent first and verbatim so OpenAI's automatic prefix
+    cache can reuse it; `cache_key` routes calls sharing a prompt together.
+    `json_schema` ({"name", "schema", "strict"}) switches to structured outputs
+    so the response is guaranteed to match the schema.
+    """
+    if json_schema is not None:
+        response_format = {"type": "json_schema", "json_schema": json_schema}
+    else:
+        response_format = {"type": "json_object"}
     resp = await _client.chat.completions.create(
         model=settings.CHAT_MODEL,
-        response_format={"type": "json_object"},
+        response_format=response_format,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message},
         ],
+        prompt_cache_key=cache_key or NOT_GIVEN,
     )
     text = resp.choices[0].message.content
+    if resp.usage and resp.usage.prompt_tokens_details:
+        log.debug(
+            "chat_json prompt tokens: %d (cached %d)",
+            resp.usage.prompt_tokens, resp.usage.prompt_tokens_details.cached_tokens or 0,
+        )
     log.debug("chat_json response: %s", text[:500])
     return json.loads(text)
+
+
+async def embed(text: str) -> list[float]:
+    """Return the embedding vector for `text`."""
+    resp = await _client.embeddings.create(model=settings.EMBEDDING_MODEL, input=text)
+    return resp.data[0].embedding
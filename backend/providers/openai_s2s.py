@@ -17,6 +17,9 @@ from tools import TOOL_DEFINITIONS, execute_tool
 
 log = logging.getLogger(__name__)
 
+# One client (and httpx transport) shared by every RealtimeSession.
+_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
 GREETING_STYLES = [
     "Start by asking a fun 'would you rather' question related to the topic.",
     "Open with a surprising or little-known fact about the topic, then ask what they think.",
@@ -90,6 +93,20 @@ You are a patient English teacher conducting targeted practice for a Mandarin Ch
 """
 
 
+class _Turn:
+    """Per-response state accumulated while reading Realtime events."""
+
+    __slots__ = ("transcript_text", "response_parts", "t_first_audio")
+
+    def __init__(self):
+        self.transcript_text = ""
+        self.response_parts: list[str] = []
+        self.t_first_audio: float | None = None
+
+    @property
+    def response_text(self) -> str:
+        return "".join(self.response_parts)
+
 
 class RealtimeSession:
     """Manages one persistent WebSocket connection to OpenAI Realtime API."""
@@ -103,13 +120,20 @@ class RealtimeSession:
         self._profile = profile
         self._conversation_summary_history = conversation_history_summary
         self._review_history = review_history
-        self._client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self._client = _client
         self._conn = None
         self._event_queue: asyncio.Queue = asyncio.Queue()
         self._listener_task: asyncio.Task | None = None
         self._connected = False
         self._connected_event = asyncio.Event()
         self._turn_index = 0
+        # Hot event types dispatch through one dict lookup; rare ones fall
+        # through to the if/elif chain in _read_response.
+        self._handlers = {
+            "response.audio.delta": self._on_audio_delta,
+            "response.audio_transcript.delta": self._on_transcript_delta,
+            "conversation.item.input_audio_transcription.completed": self._on_input_transcript,
+        }
 
     def _build_conversation_system_prompt(self):
         user_profile = f"User level: {self._profile.get('level', 'unknown')}\n"
@@ -218,88 +242,26 @@ class RealtimeSession:
         await self._conn.response.create()
 
         # Read events until response.done
-        transcript_text = ""
-        response_text = ""
-        t_first_audio = None
-
-        while True:
-            try:
-                event = await asyncio.wait_for(
-                    self._event_queue.get(), timeout=30.0
-                )
-            except asyncio.TimeoutError:
-                log.warning("Timeout waiting for event")
-                break
-
-            if event is None:
-                break
-
-            event_type = event.type
-            log.debug("Event: %s", event_type)
-
-            if event_type == "conversation.item.input_audio_transcription.completed":
-                transcript_text = event.transcript or ""
-                yield _sse("transcript", {"text": transcript_text})
-
-            elif event_type == "response.audio_transcript.delta":
-                response_text += event.delta or ""
-
-            elif event_type == "response.audio.delta":
-                if t_first_audio is None:
-                    t_first_audio = time.monotonic()
-                yield _sse("audio", {"audio": event.delta})
-
-            elif event_type == "response.output_item.done":
-                item = event.item
-                if getattr(item, "type", None) == "function_call":
-                    await self._handle_tool_call(item)
-                    continue  # new response will follow
-
-            elif event_type == "response.done":
-                break
-
-            elif event_type == "error":
-                log.error("Realtime API error: %s", event)
-                break
+        turn = _Turn()
+        async for sse in self._read_response(turn):
+            yield sse
 
+        transcript_text = turn.transcript_text
+        response_text = turn.response_text
         if response_text:
             yield _sse("response", {"text": response_text})
 
         # Persist segment to DB
         if transcript_text and response_text:
-            try:
-                db = await get_db()
-                await db.execute(
-                    "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
-                    "VALUES (?, ?, ?, ?, ?)",
-                    (self.session_id, self._turn_index, transcript_text, response_text,
-                     datetime.now(timezone.utc).isoformat()),
-                )
-                await db.commit()
-                log.info(
-                    "Segment saved: session=%s turn=%d user_text=%s",
-                    self.session_id, self._turn_index, transcript_text[:80],
-                )
-                self._turn_index += 1
-            except Exception as e:
-                log.error("Failed to persist segment: %s", e)
+            await self._save_segment(transcript_text, response_text)
         else:
             log.warning(
                 "Segment NOT saved (empty): session=%s transcript=%r response=%r",
                 self.session_id, bool(transcript_text), bool(response_text),
             )
 
-        t_end = time.monotonic()
-        if t_first_audio:
-            yield _sse(
-                "timing",
-                {"step": "first_audio", "duration_s": round(t_first_audio - t_start, 3)},
-            )
-        yield _sse(
-            "timing",
-            {"step": "total", "duration_s": round(t_end - t_start, 3)},
-        )
-        yield _sse("done", {})
+        for sse in _timing_events(t_start, turn):
+            yield sse
 
     async def stream_greeting(self) -> AsyncGenerator[str, None]:
         """
@@ -310,53 +272,16 @@ class RealtimeSession:
             raise RuntimeError("Session not connected")
 
         t_start = time.monotonic()
-        response_text = ""
-        t_first_audio = None
-
-        while True:
-            try:
-                event = await asyncio.wait_for(
-                    self._event_queue.get(), timeout=30.0
-                )
-            except asyncio.TimeoutError:
-                log.warning("Timeout waiting for greeting event")
-                break
-
-            if event is None:
-                break
-
-            event_type = event.type
-            log.debug("Greeting event: %s", event_type)
-
-            if event_type == "response.audio_transcript.delta":
-                response_text += event.delta or ""
-
-            elif event_type == "response.audio.delta":
-                if t_first_audio is None:
-                    t_first_audio = time.monotonic()
-                yield _sse("audio", {"audio": event.delta})
-
-            elif event_type == "response.done":
-                break
-
-            elif event_type == "error":
-                log.error("Realtime API error during greeting: %s", event)
-                break
+        turn = _Turn()
+        async for sse in self._read_response(turn, greeting=True):
+            yield sse
 
+        response_text = turn.response_text
         if response_text:
             yield _sse("response", {"text": response_text})
 
-        t_end = time.monotonic()
-        if t_first_audio:
-            yield _sse(
-                "timing",
-                {"step": "first_audio", "duration_s": round(t_first_audio - t_start, 3)},
-            )
-        yield _sse(
-            "timing",
-            {"step": "total", "duration_s": round(t_end - t_start, 3)},
-        )
-        yield _sse("done", {})
+        for sse in _timing_events(t_start, turn):
+            yield sse
 
     async def send_text_and_stream(
         self, text: str
@@ -391,16 +316,52 @@ class RealtimeSession:
         yield _sse("transcript", {"text": text})
 
         # Read events until response.done
-        response_text = ""
-        t_first_audio = None
+        turn = _Turn()
+        async for sse in self._read_response(turn):
+            yield sse
+
+        response_text = turn.response_text
+        if response_text:
+            yield _sse("response", {"text": response_text})
+
+        # Persist segment to DB
+        if text and response_text:
+            await self._save_segment(text, response_text)
+
+        for sse in _timing_events(t_start, turn):
+            yield sse
 
+    async def _save_segment(self, user_text: str, ai_text: str) -> None:
+        """Insert the finished turn through the shared connection pool."""
+        try:
+            db = await get_db()
+            await db.execute(
+                "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.session_id, self._turn_index, user_text, ai_text,
+                 datetime.now(timezone.utc).isoformat()),
+            )
+            await db.commit()
+            log.info(
+                "Segment saved: session=%s turn=%d user_text=%s",
+                self.session_id, self._turn_index, user_text[:80],
+            )
+            self._turn_index += 1
+        except Exception as e:
+            log.error("Failed to persist segment: %s", e)
+
+    async def _read_response(
+        self, turn: _Turn, greeting: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """Read events until response.done, updating `turn` and yielding SSE events."""
+        handlers = self._handlers
         while True:
             try:
                 event = await asyncio.wait_for(
                     self._event_queue.get(), timeout=30.0
                 )
             except asyncio.TimeoutError:
-                log.warning("Timeout waiting for event")
+                log.warning("Timeout waiting for %s", "greeting event" if greeting else "event")
                 break
 
             if event is None:
@@ -409,60 +370,35 @@ class RealtimeSession:
             event_type = event.type
             log.debug("Event: %s", event_type)
 
-            if event_type == "response.audio_transcript.delta":
-                response_text += event.delta or ""
-
-            elif event_type == "response.audio.delta":
-                if t_first_audio is None:
-                    t_first_audio = time.monotonic()
-                yield _sse("audio", {"audio": event.delta})
+            handler = handlers.get(event_type)
+            if handler is not None:
+                sse = handler(event, turn)
+                if sse is not None:
+                    yield sse
 
             elif event_type == "response.output_item.done":
                 item = event.item
-                if getattr(item, "type", None) == "function_call":
-                    await self._handle_tool_call(item)
-                    continue
+                if not greeting and getattr(item, "type", None) == "function_call":
+                    await self._handle_tool_call(item)  # new response will follow
 
             elif event_type == "response.done":
                 break
 
             elif event_type == "error":
-                log.error("Realtime API error: %s", event)
+                log.error("Realtime API error%s: %s", " during greeting" if greeting else "", event)
                 break
 
-        if response_text:
-            yield _sse("response", {"text": response_text})
+    def _on_audio_delta(self, event, turn: _Turn) -> str:
+        if turn.t_first_audio is None:
+            turn.t_first_audio = time.monotonic()
+        return _sse_audio(event.delta)
 
-        # Persist segment to DB
-        if text and response_text:
-            try:
-                db = await get_db()
-                await db.execute(
-                    "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
-                    "VALUES (?, ?, ?, ?, ?)",
-                    (self.session_id, self._turn_index, text, response_text,
-                     datetime.now(timezone.utc).isoformat()),
-                )
-                await db.commit()
-                log.info(
-                    "Segment saved: session=%s turn=%d user_text=%s",
-                    self.session_id, self._turn_index, text[:80],
-                )
-                self._turn_index += 1
-            except Exception as e:
-                log.error("Failed to persist segment: %s", e)
-
-        t_end = time.monotonic()
-        if t_first_audio:
-            yield _sse(
-                "timing",
-                {"step": "first_audio", "duration_s": round(t_first_audio - t_start, 3)},
-            )
-        yield _sse(
-            "timing",
-            {"step": "total", "duration_s": round(t_end - t_start, 3)},
-        )
-        yield _sse("done", {})
+    def _on_transcript_delta(self, event, turn: _Turn) -> None:
+        turn.response_parts.append(event.delta or "")
+
+    def _on_input_transcript(self, event, turn: _Turn) -> str:
+        turn.transcript_text = event.transcript or ""
+        return _sse("transcript", {"text": turn.transcript_text})
 
     async def _handle_tool_call(self, item) -> None:
         """Execute a tool call and send the result back, triggering a new response."""
@@ -471,10 +407,12 @@ class RealtimeSession:
         call_id = item.call_id
         log.info("Tool call: %s(%s)", name, args_str)
 
-        try:
-            args = json.loads(args_str)
-        except json.JSONDecodeError:
-            args = {}
+        args = {}
+        if args_str != "{}":
+            try:
+                args = json.loads(args_str)
+            except json.JSONDecodeError:
+                pass
 
         result = execute_tool(name, args)
         log.info("Tool result: %s", result[:200])
@@ -491,6 +429,9 @@ class RealtimeSession:
     async def close(self) -> None:
         """Shut down the session."""
         self._connected = False
+        # A failed connect may have set this before erroring; a retry must
+        # not look connected while it backs off
+        self._connected_event.clear()
         if self._listener_task:
             self._listener_task.cancel()
             try:
@@ -502,7 +443,35 @@ class RealtimeSession:
                 await self._conn.close()
             except Exception:
                 pass
+        # connect() starts the listener before response.create(); if a retry
+        # reuses this session, a sentinel or stray events left by the failed
+        # attempt must not end the next greeting stream early.
+        self._conn = None
+        self._listener_task = None
+        self._event_queue = asyncio.Queue()
 
 
 def _sse(event: str, data: dict) -> str:
     return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_audio(audio_b64: str) -> str:
+    # Base64 never needs JSON escaping, so skip json.dumps on the largest payload.
+    return f'event: audio\ndata: {{"audio": "{audio_b64}"}}\n\n'
+
+
+def _timing_events(t_start: float, turn: _Turn) -> list[str]:
+    """Build the trailing timing + done SSE events for a response."""
+    t_end = time.monotonic()
+    events = []
+    if turn.t_first_audio:
+        events.append(_sse(
+            "timing",
+            {"step": "first_audio", "duration_s": round(turn.t_first_audio - t_start, 3)},
+        ))
+    events.append(_sse(
+        "timing",
+        {"step": "total", "duration_s": round(t_end - t_start, 3)},
+    ))
+    events.append(_sse("done", {}))
+    return events
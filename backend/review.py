@@ -1,12 +1,29 @@
-import json
+import asyncio
+import hashlib
 import logging
-from datetime import datetime, timezone
+import math
+import operator
+from array import array
+from datetime import datetime, timedelta, timezone
 
+import orjson
+
+from config import settings
+from constants import IssueDimension
 from db import get_db
-from providers.openai_chat import chat_json
+from providers.openai_chat import chat_json, embed
 
 log = logging.getLogger(__name__)
 
+
+def _dumps(obj) -> str:
+    """JSON-encode to str; orjson emits UTF-8, so non-ASCII text is kept as-is."""
+    return orjson.dumps(obj).decode()
+
+
+_loads = orjson.loads
+
+
 REVIEW_SYSTEM_PROMPT = """\
 You are an English language learning assistant for Mandarin Chinese speakers.
 
@@ -30,6 +47,37 @@ Keep explanations clear and concise in Traditional Chinese (繁體中文). \
 Suggestions should be natural, level-appropriate English.\
 """
 
+# Structured-output schema for REVIEW_SYSTEM_PROMPT responses
+REVIEW_MARKS_SCHEMA = {
+    "name": "review_marks",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "marks": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "turn_index": {"type": "integer"},
+                        "issue_types": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": [d.value for d in IssueDimension]},
+                        },
+                        "original": {"type": "string"},
+                        "suggestion": {"type": "string"},
+                        "explanation": {"type": "string"},
+                    },
+                    "required": ["turn_index", "issue_types", "original", "suggestion", "explanation"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["marks"],
+        "additionalProperties": False,
+    },
+}
+
 CORRECTION_SYSTEM_PROMPT = """\
 You are an English learning assistant for Mandarin Chinese speakers.
 The learner is reviewing their conversation and pointing at something they
@@ -117,28 +165,75 @@ Respond as JSON: { "summary": "..." }\
 """
 
 
-async def generate_chat_summary(session_id: str, topic_id: str) -> dict:
-    """Generate a brief content summary of the conversation and store in chat_summaries."""
+async def load_transcript(db, session_id: str) -> list[dict]:
+    """Fetch a session's segments in turn order, for passing to several generate_* calls."""
+    return await db.execute_fetchall(
+        "SELECT id, turn_index, user_text, ai_text FROM segments "
+        "WHERE session_id = ? ORDER BY turn_index",
+        (session_id,),
+    )
+
+
+def _format_transcript(rows) -> str:
+    """Render segment rows as the Turn/User/AI transcript sent to the LLM."""
+    return "\n".join(
+        f"Turn {row['turn_index']}:\n  User: {row['user_text']}\n  AI: {row['ai_text']}"
+        for row in rows
+    )
+
+
+async def _cached_chat_json(
+    system_prompt: str, user_message: str, cache_key: str, json_schema: dict | None = None,
+) -> dict:
+    """chat_json with an exact-match cache on (model, schema, system prompt, user message).
+
+    Used for the transcript-only calls, which are deterministic for a given session
+    and get re-run on retries. Entries older than LLM_CACHE_TTL_SECONDS are ignored,
+    and purged whenever a new entry is written.
+    """
     db = await get_db()
+    schema = _dumps(json_schema) if json_schema is not None else ""
+    key = hashlib.blake2b(
+        f"{settings.CHAT_MODEL}\0{schema}\0{system_prompt}\0{user_message}".encode(),
+        digest_size=16,
+    ).hexdigest()
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)).isoformat()
 
     rows = await db.execute_fetchall(
-        "SELECT turn_index, user_text, ai_text FROM segments "
-        "WHERE session_id = ? ORDER BY turn_index",
-        (session_id,),
+        "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+        (key, cutoff),
     )
+    if rows:
+        log.info("LLM cache hit for %s", cache_key)
+        return _loads(rows[0]["response"])
+
+    result = await chat_json(system_prompt, user_message, cache_key=cache_key, json_schema=json_schema)
+    # The purge skips this key; its expired row is replaced by the upsert instead
+    await db.execute(
+        "WITH expired AS (DELETE FROM llm_cache WHERE created_at < ? AND key <> ?) "
+        "INSERT INTO llm_cache (key, response, created_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, created_at = EXCLUDED.created_at",
+        (cutoff, key, key, _dumps(result), now.isoformat()),
+    )
+    return result
+
+
+async def generate_chat_summary(session_id: str, topic_id: str, rows: list[dict] | None = None) -> dict:
+    """Generate a brief content summary of the conversation and store in chat_summaries.
+    `rows` may be passed from load_transcript to skip the segments query."""
+    db = await get_db()
+
+    if rows is None:
+        rows = await load_transcript(db, session_id)
 
     if not rows:
         log.warning("No segments for session %s, skipping chat summary", session_id)
         return {"summary": ""}
 
-    transcript_lines = []
-    for row in rows:
-        transcript_lines.append(f"Turn {row['turn_index']}:")
-        transcript_lines.append(f"  User: {row['user_text']}")
-        transcript_lines.append(f"  AI: {row['ai_text']}")
-    transcript = "\n".join(transcript_lines)
+    transcript = _format_transcript(rows)
 
-    result = await chat_json(CHAT_SUMMARY_SYSTEM_PROMPT, transcript)
+    result = await _cached_chat_json(CHAT_SUMMARY_SYSTEM_PROMPT, transcript, cache_key="chat_summary")
     summary = result.get("summary", "")
 
     now = datetime.now(timezone.utc).isoformat()
@@ -154,36 +249,32 @@ async def generate_chat_summary(session_id: str, topic_id: str) -> dict:
     return {"summary": summary}
 
 
-async def generate_review(session_id: str) -> None:
-    """Fetch all segments for a session, call GPT-4o to generate AI Marks, write to DB."""
+async def generate_review(session_id: str, rows: list[dict] | None = None) -> None:
+    """Fetch all segments for a session, call GPT-4o to generate AI Marks, write to DB.
+    `rows` may be passed from load_transcript to skip the segments query."""
     db = await get_db()
 
-    rows = await db.execute_fetchall(
-        "SELECT id, turn_index, user_text, ai_text FROM segments "
-        "WHERE session_id = ? ORDER BY turn_index",
-        (session_id,),
-    )
+    if rows is None:
+        rows = await load_transcript(db, session_id)
 
     if not rows:
         log.warning("No segments found for session %s, skipping review", session_id)
         return
 
-    transcript_lines = []
-    for row in rows:
-        transcript_lines.append(f"Turn {row['turn_index']}:")
-        transcript_lines.append(f"  User: {row['user_text']}")
-        transcript_lines.append(f"  AI: {row['ai_text']}")
-    transcript = "\n".join(transcript_lines)
-    log.info("Review input for session %s (%d segments):\n%s", session_id, len(rows), transcript)
+    transcript = _format_transcript(rows)
+    log.debug("Review input for session %s (%d segments):\n%s", session_id, len(rows), transcript)
 
-    result = await chat_json(REVIEW_SYSTEM_PROMPT, transcript)
-    log.info("Review raw response for session %s: %s", session_id, json.dumps(result, ensure_ascii=False))
+    result = await _cached_chat_json(
+        REVIEW_SYSTEM_PROMPT, transcript, cache_key="review", json_schema=REVIEW_MARKS_SCHEMA,
+    )
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Review raw response for session %s: %s", session_id, _dumps(result))
 
     marks = result.get("marks", [])
     log.info("Review result for session %s: %d marks", session_id, len(marks))
     seg_map = {row["turn_index"]: row["id"] for row in rows}
 
-    inserted = 0
+    rows_to_insert = []
     for mark in marks:
         turn_idx = mark.get("turn_index")
         segment_id = seg_map.get(turn_idx)
@@ -193,18 +284,71 @@ async def generate_review(session_id: str) -> None:
         original = mark.get("original")
         suggestion = mark.get("suggestion")
         explanation = mark.get("explanation")
+        # The schema guarantees the keys but not non-empty values
         if not issue_types or not all([original, suggestion, explanation]):
             log.warning("Skipping malformed mark for turn %s: %s", turn_idx, mark)
             continue
-        await db.execute(
-            "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (segment_id, json.dumps(issue_types, ensure_ascii=False), original, suggestion, explanation),
+        rows_to_insert.append(
+            (segment_id, _dumps(issue_types), original, suggestion, explanation)
         )
-        inserted += 1
 
+    await db.executemany(
+        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
+        "VALUES (?, ?, ?, ?, ?)",
+        rows_to_insert,
+    )
     await db.commit()
-    log.info("Review written for session %s: %d marks", session_id, inserted)
+    log.info("Review written for session %s: %d marks", session_id, len(rows_to_insert))
+
+
+async def _embed_or_none(text: str) -> list[float] | None:
+    """Embed text for the correction cache; the cache is best-effort, so failures return None."""
+    try:
+        return await embed(text)
+    except Exception as e:
+        log.warning("Embedding failed, skipping correction cache: %s", e)
+        return None
+
+
+def _quantize(vector: list[float]) -> array:
+    """Scale to int8 so the largest component is ±127. Cosine similarity is
+    scale-invariant, so the per-vector scale doesn't need to be kept."""
+    peak = max(map(abs, vector), default=0.0)
+    scale = 127 / peak if peak else 0.0
+    return array("b", [round(x * scale) for x in vector])
+
+
+def _pack_embedding(vector: list[float]) -> bytes:
+    return _quantize(vector).tobytes()
+
+
+def _cosine(a, b) -> float:
+    dot = sum(map(operator.mul, a, b))
+    norm = math.sqrt(sum(map(operator.mul, a, a)) * sum(map(operator.mul, b, b)))
+    return dot / norm if norm else 0.0
+
+
+async def _find_cached_correction(db, segment_id: int, embedding: list[float]) -> tuple[str, str] | None:
+    """Return (correction, explanation) of the closest earlier question on this segment
+    if it is within CORRECTION_CACHE_THRESHOLD cosine similarity."""
+    rows = await db.execute_fetchall(
+        "SELECT embedding, correction, explanation FROM correction_cache WHERE segment_id = ?",
+        (segment_id,),
+    )
+    query = _quantize(embedding)
+    best, best_score = None, settings.CORRECTION_CACHE_THRESHOLD
+    for row in rows:
+        candidate = array("b")
+        candidate.frombytes(row["embedding"])
+        # Also skips float32 blobs written before embeddings were quantized
+        if len(candidate) != len(query):
+            continue
+        score = _cosine(candidate, query)
+        if score >= best_score:
+            best, best_score = row, score
+    if best is None:
+        return None
+    return best["correction"], best["explanation"]
 
 
 async def generate_correction(session_id: str, segment_id: int, user_message: str) -> dict:
@@ -219,33 +363,50 @@ async def generate_correction(session_id: str, segment_id: int, user_message: st
         raise ValueError(f"Segment {segment_id} not found in session {session_id}")
 
     seg = rows[0]
-    marks = await db.execute_fetchall(
-        "SELECT issue_types, original, suggestion, explanation FROM ai_marks WHERE segment_id = ?",
-        (segment_id,),
+    # Embed the learner message while the marks are fetched
+    marks, embedding = await asyncio.gather(
+        db.execute_fetchall(
+            "SELECT issue_types, original, suggestion, explanation FROM ai_marks WHERE segment_id = ?",
+            (segment_id,),
+        ),
+        _embed_or_none(user_message),
     )
 
-    marks_lines = []
-    for idx, mark in enumerate(marks, 1):
-        issue_types = json.loads(mark["issue_types"]) if mark["issue_types"] else []
-        marks_lines.append(
-            f"  Mark {idx}: issue_types={issue_types}, original={mark['original']}, "
-            f"suggestion={mark['suggestion']}, explanation={mark['explanation']}"
+    cached = await _find_cached_correction(db, segment_id, embedding) if embedding else None
+    if cached is not None:
+        correction, explanation = cached
+        log.info("Correction cache hit for segment %s", segment_id)
+    else:
+        marks_lines = []
+        for idx, mark in enumerate(marks, 1):
+            issue_types = _loads(mark["issue_types"]) if mark["issue_types"] else []
+            marks_lines.append(
+                f"  Mark {idx}: issue_types={issue_types}, original={mark['original']}, "
+                f"suggestion={mark['suggestion']}, explanation={mark['explanation']}"
+            )
+
+        marks_text = "\n".join(marks_lines) if marks_lines else "  (No AI marks for this segment yet)"
+
+        user_msg = (
+            f"Segment context:\n"
+            f"  User said: {seg['user_text']}\n"
+            f"  AI responded: {seg['ai_text']}\n"
+            f"AI marks:\n{marks_text}\n\n"
+            f"Learner's message: {user_message}"
         )
 
-    marks_text = "\n".join(marks_lines) if marks_lines else "  (No AI marks for this segment yet)"
-
-    user_msg = (
-        f"Segment context:\n"
-        f"  User said: {seg['user_text']}\n"
-        f"  AI responded: {seg['ai_text']}\n"
-        f"AI marks:\n{marks_text}\n\n"
-        f"Learner's message: {user_message}"
-    )
+        result = await chat_json(CORRECTION_SYSTEM_PROMPT, user_msg, cache_key="correction")
 
-    result = await chat_json(CORRECTION_SYSTEM_PROMPT, user_msg)
+        correction = result.get("correction", "")
+        explanation = result.get("explanation", "")
 
-    correction = result.get("correction", "")
-    explanation = result.get("explanation", "")
+        if embedding:
+            await db.execute(
+                "INSERT INTO correction_cache (segment_id, embedding, correction, explanation, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (segment_id, _pack_embedding(embedding), correction, explanation,
+                 datetime.now(timezone.utc).isoformat()),
+            )
 
     now = datetime.now(timezone.utc).isoformat()
     row = await db.execute(
@@ -265,40 +426,41 @@ async def generate_correction(session_id: str, segment_id: int, user_message: st
     }
 
 
-async def generate_session_review(session_id: str, user_id: str) -> dict | None:
+async def generate_session_review(
+    session_id: str, user_id: str, rows: list[dict] | None = None,
+) -> dict | None:
     """Generate final session review with strengths, weaknesses, level assessment.
-    Returns None if no segments exist (nothing to review)."""
+    Returns None if no segments exist (nothing to review).
+    `rows` may be passed from load_transcript to skip the segments query."""
+    if rows is not None and not rows:
+        log.warning("No segments for session %s, skipping session review", session_id)
+        return None
+
     db = await get_db()
 
-    # Fetch transcript
-    segments = await db.execute_fetchall(
-        "SELECT id, turn_index, user_text, ai_text FROM segments "
-        "WHERE session_id = ? ORDER BY turn_index",
-        (session_id,),
-    )
+    # Fetch transcript, AI marks and corrections concurrently (each query gets its own pooled connection)
+    queries = [
+        db.execute_fetchall(
+            "SELECT segment_id, issue_types, original, suggestion, explanation FROM ai_marks "
+            "WHERE segment_id IN (SELECT id FROM segments WHERE session_id = ?)",
+            (session_id,),
+        ),
+        db.execute_fetchall(
+            "SELECT segment_id, user_message, correction, explanation "
+            "FROM corrections WHERE session_id = ?",
+            (session_id,),
+        ),
+    ]
+    if rows is None:
+        segments, marks, corrections = await asyncio.gather(load_transcript(db, session_id), *queries)
+    else:
+        segments = rows
+        marks, corrections = await asyncio.gather(*queries)
 
     if not segments:
         log.warning("No segments for session %s, skipping session review", session_id)
         return None
 
-    # Fetch AI marks
-    seg_ids = [s["id"] for s in segments]
-    marks = []
-    if seg_ids:
-        placeholders = ",".join("?" * len(seg_ids))
-        marks = await db.execute_fetchall(
-            f"SELECT segment_id, issue_types, original, suggestion, explanation "
-            f"FROM ai_marks WHERE segment_id IN ({placeholders})",
-            seg_ids,
-        )
-
-    # Fetch corrections
-    corrections = await db.execute_fetchall(
-        "SELECT segment_id, user_message, correction, explanation "
-        "FROM corrections WHERE session_id = ?",
-        (session_id,),
-    )
-
     # Build prompt
     parts = ["Conversation transcript:"]
     for seg in segments:
@@ -307,7 +469,7 @@ async def generate_session_review(session_id: str, user_id: str) -> dict | None:
     if marks:
         parts.append("\nAI-identified issues:")
         for m in marks:
-            types = json.loads(m["issue_types"]) if isinstance(m["issue_types"], str) else m["issue_types"]
+            types = _loads(m["issue_types"]) if isinstance(m["issue_types"], str) else m["issue_types"]
             types_str = ", ".join(types)
             parts.append(f"  [{types_str}] \"{m['original']}\" → \"{m['suggestion']}\" ({m['explanation']})")
 
@@ -316,7 +478,7 @@ async def generate_session_review(session_id: str, user_id: str) -> dict | None:
         for c in corrections:
             parts.append(f"  Learner asked: {c['user_message']} → Correction: {c['correction']}")
 
-    result = await chat_json(SESSION_REVIEW_SYSTEM_PROMPT, "\n".join(parts))
+    result = await chat_json(SESSION_REVIEW_SYSTEM_PROMPT, "\n".join(parts), cache_key="session_review")
 
     strengths = result.get("strengths", [])
     weaknesses = result.get("weaknesses", {})
@@ -331,8 +493,8 @@ async def generate_session_review(session_id: str, user_id: str) -> dict | None:
         (
             session_id,
             user_id,
-            json.dumps(strengths, ensure_ascii=False),
-            json.dumps(weaknesses, ensure_ascii=False),
+            _dumps(strengths),
+            _dumps(weaknesses),
             overall,
             now,
         ),
@@ -351,24 +513,15 @@ async def generate_review_summary(session_id: str, user_id: str) -> dict | None:
     Returns None if no segments exist."""
     db = await get_db()
 
-    rows = await db.execute_fetchall(
-        "SELECT turn_index, user_text, ai_text FROM segments "
-        "WHERE session_id = ? ORDER BY turn_index",
-        (session_id,),
-    )
+    rows = await load_transcript(db, session_id)
 
     if not rows:
         log.warning("No segments for review session %s, skipping review summary", session_id)
         return None
 
-    transcript_lines = []
-    for row in rows:
-        transcript_lines.append(f"Turn {row['turn_index']}:")
-        transcript_lines.append(f"  User: {row['user_text']}")
-        transcript_lines.append(f"  AI: {row['ai_text']}")
-    transcript = "\n".join(transcript_lines)
+    transcript = _format_transcript(rows)
 
-    result = await chat_json(REVIEW_SUMMARY_SYSTEM_PROMPT, transcript)
+    result = await chat_json(REVIEW_SUMMARY_SYSTEM_PROMPT, transcript, cache_key="review_summary")
 
     practiced = result.get("practiced", [])
     notes = result.get("notes", "")
@@ -378,7 +531,7 @@ async def generate_review_summary(session_id: str, user_id: str) -> dict | None:
         "INSERT INTO review_summaries (session_id, user_id, practiced, notes, created_at) "
         "VALUES (?, ?, ?, ?, ?) "
         "ON CONFLICT (session_id) DO UPDATE SET user_id = EXCLUDED.user_id, practiced = EXCLUDED.practiced, notes = EXCLUDED.notes, created_at = EXCLUDED.created_at",
-        (session_id, user_id, json.dumps(practiced, ensure_ascii=False), notes, now),
+        (session_id, user_id, _dumps(practiced), notes, now),
     )
     await db.commit()
     log.info("Review summary saved for session %s", session_id)
@@ -218,6 +218,10 @@ def seed_data(database_url: str, user_id: str, session_id: str) -> tuple[int, st
         "DELETE FROM ai_marks WHERE segment_id IN (SELECT id FROM segments WHERE session_id = %s)",
         (session_id,),
     )
+    cur.execute(
+        "DELETE FROM correction_cache WHERE segment_id IN (SELECT id FROM segments WHERE session_id = %s)",
+        (session_id,),
+    )
     cur.execute("DELETE FROM segments WHERE session_id = %s", (session_id,))
     cur.execute("DELETE FROM sessions WHERE id = %s", (session_id,))
 
@@ -12,7 +12,6 @@ import argparse
 import json
 import os
 import sys
-import time
 from datetime import datetime, timezone
 
 import httpx
@@ -35,7 +34,12 @@ def seed_data(database_url: str, user_id: str, session_id: str) -> None:
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     # Make reruns idempotent for the same session_id/user_id.
+    # Everything below runs in one transaction with a single commit at the end.
     cur.execute("DELETE FROM corrections WHERE session_id = %s", (session_id,))
+    cur.execute(
+        "DELETE FROM correction_cache WHERE segment_id IN (SELECT id FROM segments WHERE session_id = %s)",
+        (session_id,),
+    )
     cur.execute(
         "DELETE FROM ai_marks WHERE segment_id IN (SELECT id FROM segments WHERE session_id = %s)",
         (session_id,),
@@ -67,40 +71,34 @@ def seed_data(database_url: str, user_id: str, session_id: str) -> None:
         ("Yesterday I go to office and discuss project with my boss.", "Got it. What was the key discussion?"),
         ("We discuss about timeline, and I very worry can not finish.", "Thanks for sharing. What made you most worried?"),
     ]
-    for idx, (u, a) in enumerate(turns):
-        cur.execute(
-            "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) VALUES (%s, %s, %s, %s, %s)",
-            (session_id, idx, u, a, now_iso()),
-        )
-
-    conn.commit()
-
-    cur.execute(
-        "SELECT id, turn_index FROM segments WHERE session_id = %s ORDER BY turn_index",
-        (session_id,),
+    seg_rows = psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) VALUES %s "
+        "RETURNING id, turn_index",
+        [(session_id, idx, u, a, now_iso()) for idx, (u, a) in enumerate(turns)],
+        fetch=True,
     )
-    seg_rows = cur.fetchall()
     seg_id = {r["turn_index"]: r["id"] for r in seg_rows}
 
-    cur.execute(
-        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) VALUES (%s, %s, %s, %s, %s)",
-        (
-            seg_id[0],
-            json.dumps(["grammar"], ensure_ascii=False),
-            "Yesterday I go to office",
-            "Yesterday I went to the office",
-            "過去式與冠詞",
-        ),
-    )
-    cur.execute(
-        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) VALUES (%s, %s, %s, %s, %s)",
-        (
-            seg_id[1],
-            json.dumps(["grammar", "sentence_structure"], ensure_ascii=False),
-            "I very worry can not finish",
-            "I am very worried that I can't finish",
-            "be 動詞與子句結構",
-        ),
+    psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) VALUES %s",
+        [
+            (
+                seg_id[0],
+                json.dumps(["grammar"], ensure_ascii=False),
+                "Yesterday I go to office",
+                "Yesterday I went to the office",
+                "過去式與冠詞",
+            ),
+            (
+                seg_id[1],
+                json.dumps(["grammar", "sentence_structure"], ensure_ascii=False),
+                "I very worry can not finish",
+                "I am very worried that I can't finish",
+                "be 動詞與子句結構",
+            ),
+        ],
     )
     cur.execute(
         "INSERT INTO corrections (session_id, segment_id, user_message, correction, explanation, created_at) "
@@ -135,7 +133,7 @@ def main() -> None:
     seed_data(database_url, args.user_id, args.session_id)
     print(f"Seeded session={args.session_id}, user={args.user_id}")
 
-    with httpx.Client(base_url=args.base_url, timeout=20.0) as client:
+    with httpx.Client(base_url=args.base_url, timeout=20.0, http2=True) as client:
         before = client.get(f"/sessions/{args.session_id}/review")
         before.raise_for_status()
         before_payload = before.json()
@@ -159,15 +157,13 @@ def main() -> None:
         end_resp.raise_for_status()
         print("POST /end:", end_resp.json())
 
-        for _ in range(30):
-            r = client.get(f"/sessions/{args.session_id}/review")
-            r.raise_for_status()
-            payload = r.json()
-            if payload.get("status") == "completed":
-                print("Review status: completed")
-                print("Session summary:", json.dumps(payload.get("summary"), ensure_ascii=False, indent=2))
-                break
-            time.sleep(1)
+        # Long-poll: the server answers as soon as finalization marks the session completed
+        r = client.get(f"/sessions/{args.session_id}/review/wait", params={"timeout": 30}, timeout=40.0)
+        r.raise_for_status()
+        payload = r.json()
+        if payload.get("status") == "completed":
+            print("Review status: completed")
+            print("Session summary:", json.dumps(payload.get("summary"), ensure_ascii=False, indent=2))
         else:
             print("Timed out waiting for completed status")
 
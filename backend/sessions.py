@@ -1,7 +1,10 @@
 import asyncio
-import json
 import logging
-import uuid
+import secrets
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
 from config import settings
@@ -14,41 +17,91 @@ from review import generate_review, generate_review_summary
 
 log = logging.getLogger(__name__)
 
-_sessions: dict[str, RealtimeSession] = {}
-_session_user_ids: dict[str, str] = {}
-_session_modes: dict[str, str] = {}
+# Realtime connect attempts per session; the delay before retry n is
+# CONNECT_BACKOFF_SECONDS * 4**n (0.5s, then 2s)
+CONNECT_ATTEMPTS = 3
+CONNECT_BACKOFF_SECONDS = 0.5
+
+
+@dataclass(slots=True)
+class SessionEntry:
+    """Everything kept in memory for one live session."""
+
+    session: RealtimeSession
+    user_id: str
+    mode: str
+    created_at: str
+    persist_task: asyncio.Task | None = None
+    connect_task: asyncio.Task | None = None
+
+
+_sessions: dict[str, SessionEntry] = {}
+# Set when a background task changes a session's status, so
+# GET /sessions/{id}/review/wait can re-check without polling. Entries only
+# exist while a request is watching (see watch_status).
+_status_events: dict[str, asyncio.Event] = {}
+_status_watchers: dict[str, int] = {}
+
+
+_REVIEW_DIMENSIONS = tuple((dim, labels["en"]) for dim, labels in DIMENSION_LABELS.items())
+
+
+def _format_weak_point(label: str, p: dict) -> str:
+    stored = p["examples"] if isinstance(p["examples"], list) else []
+    examples = "".join(
+        f"\n  Wrong: \"{ex.get('wrong', '')}\" → Correct: \"{ex.get('correct', '')}\""
+        for ex in stored[:settings.MAX_EXAMPLES_FOR_REVIEW]
+        if isinstance(ex, dict)
+    )
+    return f"- [{label}] {p.get('pattern', '')}{examples}"
 
 
 def _build_weak_points_for_review(profile: dict) -> str:
-    """Build a detailed weak points description for review mode."""
-    data = profile.get("profile_data", {})
-    weak_points = data.get("weak_points", {})
+    """Build a detailed weak points description for review mode.
+
+    get_or_create_profile has already upgraded string patterns to dicts with
+    an examples list; any other stored shape it passed through is skipped.
+    """
+    weak_points = profile.get("profile_data", {}).get("weak_points", {})
     if not isinstance(weak_points, dict):
         return ""
+    return "\n".join(
+        _format_weak_point(label, p)
+        for dim, label in _REVIEW_DIMENSIONS
+        if isinstance(patterns := weak_points.get(dim), list)
+        for p in patterns[:settings.MAX_PATTERNS_FOR_REVIEW]
+        if isinstance(p, dict)
+    )
+
+
+def _new_session_id() -> str:
+    """32 hex chars: 48-bit Unix ms timestamp then 80 random bits, so ids sort by creation time."""
+    return f"{time.time_ns() // 1_000_000:012x}{secrets.token_hex(10)}"
+
 
-    lines = []
-    for dim, labels in DIMENSION_LABELS.items():
-        label = labels["en"]
-        patterns = weak_points.get(dim, [])
-        if not patterns:
-            continue
-        # Take top 3 patterns per dimension
-        for p in patterns[:settings.MAX_PATTERNS_FOR_REVIEW]:
-            if isinstance(p, dict):
-                lines.append(f"- [{label}] {p['pattern']}")
-                for ex in p.get("examples", [])[:settings.MAX_EXAMPLES_FOR_REVIEW]:
-                    lines.append(f"  Wrong: \"{ex['wrong']}\" → Correct: \"{ex['correct']}\"")
-            elif isinstance(p, str):
-                lines.append(f"- [{label}] {p}")
+_last_iso_second = 0
+_last_iso = ""
 
-    return "\n".join(lines) if lines else ""
+
+def _now_iso() -> str:
+    """UTC ISO timestamp at one-second resolution, formatted once per second.
+
+    Sessions started in the same second share a started_at, so queries ordering
+    by it break ties on id (which sorts by creation time).
+    """
+    global _last_iso_second, _last_iso
+    second = int(time.time())
+    if second != _last_iso_second:
+        _last_iso = datetime.fromtimestamp(second, timezone.utc).isoformat()
+        _last_iso_second = second
+    return _last_iso
 
 
 def convert_dt_string(dt_str: str) -> str:
     return datetime.fromisoformat(dt_str).strftime('%Y-%m-%d %H:%M:%S')
 
 async def create_session(user_id: str, topic: dict | None = None, mode: str = SessionMode.CONVERSATION, user_name: str | None = None) -> dict:
-    session_id = str(uuid.uuid4())
+    session_id = _new_session_id()
     profile = await get_or_create_profile(user_id, user_name=user_name)
     topic_id = topic.get("id") if topic else None
     history_summaries: list[str] = []
@@ -59,7 +112,7 @@ async def create_session(user_id: str, topic: dict | None = None, mode: str = Se
             "SELECT cs.topic_id, cs.summary, cs.created_at FROM chat_summaries cs "
             "JOIN sessions s ON cs.session_id = s.id "
             "WHERE s.user_id = ? AND cs.topic_id = ? "
-            f"ORDER BY s.started_at DESC LIMIT {settings.CONVERSATION_HISTORY_LIMIT}",
+            f"ORDER BY s.started_at DESC, s.id DESC LIMIT {settings.CONVERSATION_HISTORY_LIMIT}",
             (user_id, topic_id),
         )
         #
@@ -89,13 +142,25 @@ async def create_session(user_id: str, topic: dict | None = None, mode: str = Se
         conversation_history_summary=history_summaries or None,
         review_history=review_history,
     )
-    _sessions[session_id] = session
-    _session_user_ids[session_id] = user_id
-    _session_modes[session_id] = mode
+    now = _now_iso()
+    entry = SessionEntry(session=session, user_id=user_id, mode=mode, created_at=now)
+    _sessions[session_id] = entry
+
+    # Persist and connect in background so the endpoint can return immediately
+    entry.persist_task = asyncio.create_task(
+        _persist_session(session_id, user_id, now, mode, topic_id)
+    )
+    entry.connect_task = asyncio.create_task(
+        _connect_with_retry(session_id, session, entry.persist_task)
+    )
+
+    return {
+        "session_id": session_id,
+        "created_at": now,
+    }
 
-    now = datetime.now(timezone.utc).isoformat()
 
-    # Persist to DB
+async def _persist_session(session_id: str, user_id: str, now: str, mode: str, topic_id: str | None) -> None:
     db = await get_db()
     await db.execute(
         "INSERT INTO sessions (id, user_id, started_at, status, mode, topic_id) VALUES (?, ?, ?, ?, ?, ?)",
@@ -103,44 +168,94 @@ async def create_session(user_id: str, topic: dict | None = None, mode: str = Se
     )
     await db.commit()
 
-    # Connect in background so the endpoint can return immediately
-    asyncio.create_task(_connect_with_retry(session_id, session))
-
-    return {
-        "session_id": session_id,
-        "created_at": now,
-    }
-
 
-async def _connect_with_retry(session_id: str, session: RealtimeSession) -> None:
+async def _connect_with_retry(session_id: str, session: RealtimeSession, persist_task: asyncio.Task) -> None:
+    # Segments reference the sessions row, so it must exist before the
+    # session can produce any turns.
+    # Shielded so cancelling the connect (delete_session) doesn't abort the INSERT
     try:
-        await session.connect()
-        log.info("Session %s connected", session_id)
+        await asyncio.shield(persist_task)
     except Exception as e:
-        log.error("Failed to connect session %s: %s", session_id, e)
+        log.error("Failed to persist session %s: %s", session_id, e)
         _sessions.pop(session_id, None)
+        return
+
+    for attempt in range(CONNECT_ATTEMPTS):
+        try:
+            await session.connect()
+            log.info("Session %s connected", session_id)
+            return
+        except Exception as e:
+            # Drop whatever the failed attempt left open before retrying
+            await session.close()
+            if attempt == CONNECT_ATTEMPTS - 1:
+                log.error("Failed to connect session %s: %s", session_id, e)
+                _sessions.pop(session_id, None)
+                return
+            delay = CONNECT_BACKOFF_SECONDS * 4**attempt
+            log.warning(
+                "Connect attempt %d for session %s failed (%s); retrying in %.1fs",
+                attempt + 1, session_id, e, delay,
+            )
+            await asyncio.sleep(delay)
 
 
 def get_session(session_id: str) -> RealtimeSession | None:
-    return _sessions.get(session_id)
+    entry = _sessions.get(session_id)
+    return entry.session if entry else None
 
 
 def get_session_user_id(session_id: str) -> str | None:
-    return _session_user_ids.get(session_id)
+    entry = _sessions.get(session_id)
+    return entry.user_id if entry else None
 
 
 def get_session_mode(session_id: str) -> str:
-    return _session_modes.get(session_id, SessionMode.CONVERSATION)
+    entry = _sessions.get(session_id)
+    return entry.mode if entry else SessionMode.CONVERSATION
+
+
+@contextmanager
+def watch_status(session_id: str) -> Iterator[asyncio.Event]:
+    """Event set on the session's next background status change.
+    Enter it before reading the status so a change in between isn't missed;
+    the entry is dropped once the last watcher leaves."""
+    event = _status_events.get(session_id)
+    if event is None:
+        event = _status_events[session_id] = asyncio.Event()
+    _status_watchers[session_id] = _status_watchers.get(session_id, 0) + 1
+    try:
+        yield event
+    finally:
+        remaining = _status_watchers.pop(session_id) - 1
+        if remaining:
+            _status_watchers[session_id] = remaining
+        elif _status_events.get(session_id) is event:
+            del _status_events[session_id]
+
+
+def notify_status_change(session_id: str) -> None:
+    event = _status_events.pop(session_id, None)
+    if event is not None:
+        event.set()
 
 
 async def delete_session(session_id: str) -> dict | None:
-    session = _sessions.pop(session_id, None)
-    if session is None:
+    entry = _sessions.pop(session_id, None)
+    if entry is None:
         return None
-    mode = _session_modes.pop(session_id, SessionMode.CONVERSATION)
-    await session.close()
-
-    now = datetime.now(timezone.utc).isoformat()
+    mode = entry.mode
+    # A still-running connect would otherwise open a socket after close()
+    if entry.connect_task is not None and not entry.connect_task.done():
+        entry.connect_task.cancel()
+        await asyncio.gather(entry.connect_task, return_exceptions=True)
+    await entry.session.close()
+
+    # The status updates below need the INSERT to have landed
+    if entry.persist_task is not None:
+        await asyncio.gather(entry.persist_task, return_exceptions=True)
+
+    now = _now_iso()
     db = await get_db()
 
     if mode == SessionMode.REVIEW:
@@ -152,9 +267,7 @@ async def delete_session(session_id: str) -> dict | None:
         await db.commit()
         log.info("Review session %s ended (no review generation)", session_id)
 
-        user_id = _session_user_ids.pop(session_id, None)
-        if user_id:
-            asyncio.create_task(_finalize_review(session_id, user_id))
+        asyncio.create_task(_finalize_review(session_id, entry.user_id))
 
         return {"session_id": session_id, "status": SessionStatus.ENDED, "mode": mode}
 
@@ -188,6 +301,7 @@ async def _run_review(session_id: str) -> None:
             await db.commit()
         except Exception as e:
             log.error("Failed to update status to reviewed for session %s: %s", session_id, e)
+        notify_status_change(session_id)
 
 
 async def _finalize_review(session_id: str, user_id: str) -> None:
@@ -8,31 +8,47 @@ Usage:
     python test_client.py
 """
 
-import base64
-import io
+import atexit
+import binascii
 import struct
-import sys
-import threading
 import time
 
 import httpx
 import numpy as np
 import sounddevice as sd
 
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
 BASE_URL = "http://localhost:8000"
 SAMPLE_RATE = 24000  # OpenAI Realtime API uses 24kHz PCM16
 CHANNELS = 1
+MAX_RECORD_SECONDS = 60
+
+# One client for the whole run so requests reuse the kept-alive connection
+_client = httpx.Client(base_url=BASE_URL, timeout=60.0)
+atexit.register(_client.close)
 
 
 def record_audio(duration_hint: float = 0.0) -> bytes:
     """Record audio from the microphone. Press Enter to stop."""
     print("\n🎤 Recording... (press Enter to stop)")
-    frames = []
+    # Preallocated sample buffer; grows only past MAX_RECORD_SECONDS
+    buf = np.empty(SAMPLE_RATE * MAX_RECORD_SECONDS, dtype=np.int16)
+    offset = 0
     recording = True
 
     def callback(indata, frame_count, time_info, status):
-        if recording:
-            frames.append(indata.copy())
+        nonlocal buf, offset
+        if not recording:
+            return
+        end = offset + frame_count
+        if end > len(buf):
+            buf = np.resize(buf, max(end, len(buf) * 2))
+        buf[offset:end] = indata[:, 0]
+        offset = end
 
     stream = sd.InputStream(
         samplerate=SAMPLE_RATE,
@@ -46,54 +62,59 @@ def record_audio(duration_hint: float = 0.0) -> bytes:
     stream.stop()
     stream.close()
 
-    if not frames:
+    if not offset:
         return b""
 
-    audio = np.concatenate(frames, axis=0)
-    pcm_bytes = audio.tobytes()
+    pcm_bytes = buf[:offset].tobytes()
     print(f"   Recorded {len(pcm_bytes)} bytes ({len(pcm_bytes) / (SAMPLE_RATE * 2):.1f}s)")
     return pcm_bytes
 
 
-def wrap_pcm_as_wav(pcm_bytes: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+# 44-byte PCM16 mono WAV header; only the two size fields vary per call
+_WAV_TEMPLATE = struct.pack(
+    "<4sI4s4sIHHIIHH4sI",
+    b"RIFF", 0, b"WAVE",
+    b"fmt ", 16,  # chunk size
+    1,  # PCM format
+    1,  # mono
+    SAMPLE_RATE,
+    SAMPLE_RATE * 2,  # byte rate
+    2,  # block align
+    16,  # bits per sample
+    b"data", 0,
+)
+
+
+def wrap_pcm_as_wav(pcm_bytes: bytes) -> bytes:
     """Wrap raw PCM16 mono bytes in a WAV header."""
-    buf = io.BytesIO()
-    num_samples = len(pcm_bytes) // 2
-    data_size = num_samples * 2
-    # WAV header
-    buf.write(b"RIFF")
-    buf.write(struct.pack("<I", 36 + data_size))
-    buf.write(b"WAVE")
-    buf.write(b"fmt ")
-    buf.write(struct.pack("<I", 16))  # chunk size
-    buf.write(struct.pack("<H", 1))  # PCM format
-    buf.write(struct.pack("<H", 1))  # mono
-    buf.write(struct.pack("<I", sample_rate))
-    buf.write(struct.pack("<I", sample_rate * 2))  # byte rate
-    buf.write(struct.pack("<H", 2))  # block align
-    buf.write(struct.pack("<H", 16))  # bits per sample
-    buf.write(b"data")
-    buf.write(struct.pack("<I", data_size))
-    buf.write(pcm_bytes)
-    return buf.getvalue()
-
-
-def play_audio_chunks(audio_chunks: list[bytes]) -> None:
-    """Play concatenated PCM16 audio chunks."""
-    if not audio_chunks:
-        return
-    pcm = b"".join(audio_chunks)
-    if not pcm:
-        return
-    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
-    print(f"   🔊 Playing {len(pcm)} bytes ({len(pcm) / (SAMPLE_RATE * 2):.1f}s)")
-    sd.play(audio, samplerate=SAMPLE_RATE)
-    sd.wait()
+    data_size = len(pcm_bytes) // 2 * 2
+    header = bytearray(_WAV_TEMPLATE)
+    struct.pack_into("<I", header, 4, 36 + data_size)
+    struct.pack_into("<I", header, 40, data_size)
+    return bytes(header) + pcm_bytes
+
+
+def open_player() -> sd.OutputStream:
+    """Output stream that plays PCM16 chunks as soon as they are written.
+    Closing it (leaving the `with` block) waits for queued audio to finish."""
+    return sd.OutputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, dtype="int16")
+
+
+def play_chunk(player: sd.OutputStream, pcm: bytes) -> int:
+    """Queue one PCM16 chunk on the player; returns its size in bytes."""
+    if pcm:
+        player.write(np.frombuffer(pcm, dtype=np.int16))
+    return len(pcm)
+
+
+def report_played(num_bytes: int) -> None:
+    if num_bytes:
+        print(f"   🔊 Played {num_bytes} bytes ({num_bytes / (SAMPLE_RATE * 2):.1f}s)")
 
 
 def pick_topic() -> str:
     """Fetch topics from backend and let the user choose one."""
-    resp = httpx.get(f"{BASE_URL}/topics")
+    resp = _client.get("/topics")
     resp.raise_for_status()
     topics = resp.json()
 
@@ -111,8 +132,8 @@ def pick_topic() -> str:
 
 
 def create_session(user_id: str, topic_id: str) -> str:
-    resp = httpx.post(
-        f"{BASE_URL}/sessions",
+    resp = _client.post(
+        "/sessions",
         json={"user_id": user_id, "topic_id": topic_id},
     )
     resp.raise_for_status()
@@ -121,91 +142,103 @@ def create_session(user_id: str, topic_id: str) -> str:
     return data["session_id"]
 
 
+# The backend writes audio events as exactly `data: {"audio": "<base64>"}`
+_AUDIO_DATA_PREFIX = b'{"audio": "'
+_AUDIO_DATA_SUFFIX = b'"}'
+
+
+def iter_sse(resp: httpx.Response):
+    """Yield (event, data) pairs from an SSE response; data stays raw bytes."""
+    buf = b""
+    event = None
+    for chunk in resp.iter_bytes():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line[:7] == b"event: ":
+                event = line[7:].decode()
+            elif line[:6] == b"data: " and event:
+                yield event, line[6:]
+                event = None
+
+
+def decode_audio(data: bytes) -> bytes:
+    """Decode an audio event's PCM without parsing it as JSON.
+    Decodes straight from a memoryview of the payload, so the base64 text is
+    never copied out of the line first."""
+    if data.startswith(_AUDIO_DATA_PREFIX) and data.endswith(_AUDIO_DATA_SUFFIX):
+        return binascii.a2b_base64(
+            memoryview(data)[len(_AUDIO_DATA_PREFIX):-len(_AUDIO_DATA_SUFFIX)]
+        )
+    return binascii.a2b_base64(_loads(data)["audio"])
+
+
 def send_chat(session_id: str, pcm_bytes: bytes) -> None:
     """Send audio to /chat and process the SSE stream."""
     wav_bytes = wrap_pcm_as_wav(pcm_bytes)
-    audio_chunks = []
+    played = 0
 
-    with httpx.stream(
+    with open_player() as player, _client.stream(
         "POST",
-        f"{BASE_URL}/sessions/{session_id}/chat",
+        f"/sessions/{session_id}/chat",
         files={"audio": ("audio.wav", wav_bytes, "audio/wav")},
         timeout=60.0,
     ) as resp:
         resp.raise_for_status()
-        current_event = None
-
-        for line in resp.iter_lines():
-            if line.startswith("event: "):
-                current_event = line[7:]
-            elif line.startswith("data: ") and current_event:
-                import json
-                data = json.loads(line[6:])
 
-                if current_event == "transcript":
-                    print(f"\n   You said: {data['text']}")
-                elif current_event == "response":
-                    print(f"   AI said:  {data['text']}")
-                elif current_event == "audio":
-                    chunk = base64.b64decode(data["audio"])
-                    audio_chunks.append(chunk)
-                elif current_event == "timing":
-                    print(f"   ⏱ {data['step']}: {data['duration_s']}s")
-                elif current_event == "done":
-                    pass
+        for event, raw in iter_sse(resp):
+            if event == "audio":
+                played += play_chunk(player, decode_audio(raw))
+                continue
+            data = _loads(raw)
 
-                current_event = None
+            if event == "transcript":
+                print(f"\n   You said: {data['text']}")
+            elif event == "response":
+                print(f"   AI said:  {data['text']}")
+            elif event == "timing":
+                print(f"   ⏱ {data['step']}: {data['duration_s']}s")
 
-    play_audio_chunks(audio_chunks)
+    report_played(played)
 
 
 def stream_greeting(session_id: str) -> None:
     """Call /start and play the AI's greeting."""
-    import json
+    played = 0
 
-    audio_chunks = []
-
-    with httpx.stream(
+    with open_player() as player, _client.stream(
         "POST",
-        f"{BASE_URL}/sessions/{session_id}/start",
+        f"/sessions/{session_id}/start",
         timeout=60.0,
     ) as resp:
         resp.raise_for_status()
-        current_event = None
-
-        for line in resp.iter_lines():
-            if line.startswith("event: "):
-                current_event = line[7:]
-            elif line.startswith("data: ") and current_event:
-                data = json.loads(line[6:])
 
-                if current_event == "response":
-                    print(f"\n   AI: {data['text']}")
-                elif current_event == "audio":
-                    chunk = base64.b64decode(data["audio"])
-                    audio_chunks.append(chunk)
-                elif current_event == "timing":
-                    print(f"   ⏱ {data['step']}: {data['duration_s']}s")
+        for event, raw in iter_sse(resp):
+            if event == "audio":
+                played += play_chunk(player, decode_audio(raw))
+                continue
+            data = _loads(raw)
 
-                current_event = None
+            if event == "response":
+                print(f"\n   AI: {data['text']}")
+            elif event == "timing":
+                print(f"   ⏱ {data['step']}: {data['duration_s']}s")
 
-    play_audio_chunks(audio_chunks)
+    report_played(played)
 
 
 def delete_session(session_id: str) -> None:
-    resp = httpx.delete(f"{BASE_URL}/sessions/{session_id}")
+    resp = _client.delete(f"/sessions/{session_id}")
     resp.raise_for_status()
     print("Session ended. Generating review...")
 
 
 def show_review(session_id: str) -> list[dict]:
     """Fetch segments (already in DB), then wait briefly for AI marks."""
-    import json as _json
-
     print("\n--- Review ---")
 
     # Segments are persisted during chat — fetch immediately
-    resp = httpx.get(f"{BASE_URL}/sessions/{session_id}/review")
+    resp = _client.get(f"/sessions/{session_id}/review")
     resp.raise_for_status()
     data = resp.json()
     segments = data.get("segments", [])
@@ -217,20 +250,16 @@ def show_review(session_id: str) -> list[dict]:
     # Show segments right away
     print(f"   {len(segments)} segment(s) found.\n")
 
-    # Wait briefly for AI marks (background GPT-4o call)
+    # Wait briefly for AI marks (background GPT-4o call); the server holds
+    # the request until the review finishes
     has_marks = any(s.get("ai_marks") for s in segments)
     if not has_marks:
         print("   Waiting for AI marks...", end="", flush=True)
-        for attempt in range(5):
-            time.sleep(2)
-            resp = httpx.get(f"{BASE_URL}/sessions/{session_id}/review")
-            resp.raise_for_status()
-            data = resp.json()
-            segments = data.get("segments", [])
-            has_marks = any(s.get("ai_marks") for s in segments)
-            if has_marks:
-                break
-            print(".", end="", flush=True)
+        resp = _client.get(f"/sessions/{session_id}/review/wait", params={"timeout": 10})
+        resp.raise_for_status()
+        data = resp.json()
+        segments = data.get("segments", [])
+        has_marks = any(s.get("ai_marks") for s in segments)
         print(" done." if has_marks else " no marks returned.")
 
     for seg in segments:
@@ -239,7 +268,7 @@ def show_review(session_id: str) -> list[dict]:
         for mark in seg.get("ai_marks", []):
             types = mark.get("issue_types", [])
             if isinstance(types, str):
-                types = _json.loads(types)
+                types = _loads(types)
             print(f"       ⚠ [{', '.join(types)}] \"{mark['original']}\" → \"{mark['suggestion']}\"")
             print(f"         {mark.get('explanation', '')}")
 
@@ -273,8 +302,8 @@ def ask_corrections(session_id: str, segments: list[dict]) -> None:
         if not msg:
             continue
 
-        resp = httpx.post(
-            f"{BASE_URL}/sessions/{session_id}/corrections",
+        resp = _client.post(
+            f"/sessions/{session_id}/corrections",
             json={"segment_id": seg["id"], "user_message": msg},
         )
         resp.raise_for_status()
@@ -287,7 +316,7 @@ def ask_corrections(session_id: str, segments: list[dict]) -> None:
 def end_session(user_id: str, session_id: str) -> None:
     """Call POST /end (returns immediately), then poll for results."""
     print("\n--- Finalizing Session ---")
-    resp = httpx.post(f"{BASE_URL}/sessions/{session_id}/end", timeout=10.0)
+    resp = _client.post(f"/sessions/{session_id}/end", timeout=10.0)
     resp.raise_for_status()
     end_data = resp.json()
 
@@ -296,18 +325,11 @@ def end_session(user_id: str, session_id: str) -> None:
         print("   No conversation to review.")
         return
 
-    # Poll GET /review until status=completed
-    print("   Waiting for session review", end="", flush=True)
-    data = {}
-    for _ in range(10):
-        time.sleep(1)
-        resp = httpx.get(f"{BASE_URL}/sessions/{session_id}/review")
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("status") == "completed":
-            break
-        print(".", end="", flush=True)
-    print()
+    # Long-poll GET /review/wait until status=completed
+    print("   Waiting for session review...")
+    resp = _client.get(f"/sessions/{session_id}/review/wait", params={"timeout": 30})
+    resp.raise_for_status()
+    data = resp.json()
 
     summary = data.get("summary")
     if summary:
@@ -318,7 +340,7 @@ def end_session(user_id: str, session_id: str) -> None:
         print("   (Session review not ready yet — check GET /review later)")
 
     # Fetch updated profile
-    resp = httpx.get(f"{BASE_URL}/users/{user_id}/profile")
+    resp = _client.get(f"/users/{user_id}/profile")
     resp.raise_for_status()
     profile = resp.json()
     print(f"\n   Profile — Level: {profile.get('level', '?')}")
@@ -0,0 +1,93 @@
+"""Test data and insert helpers shared across test modules."""
+
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from db import get_db
+
+# Fixed timestamp for inserted rows; no code under test filters by recency
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc).isoformat()
+
+# ai_marks.issue_types as stored in the DB (JSON text)
+ISSUE_GRAMMAR = '["grammar"]'
+ISSUE_GRAMMAR_NATURALNESS = '["grammar", "naturalness"]'
+
+DEFAULT_PROFILE_JSON = json.dumps({
+    "personal_facts": [],
+    "weak_points": {"grammar": [], "naturalness": [], "sentence_structure": []},
+    "common_errors": [],
+})
+
+DEFAULT_TURNS = [
+    ("How's your day?", "It's going well! How about you?"),
+    ("The weather, I think good", "That's great to hear! The weather has been lovely."),
+]
+PAST_TENSE_TURNS = [
+    ("I go to store yesterday", "Oh, what did you buy?"),
+    ("I buy some apple", "Sounds great!"),
+]
+
+# asyncpg caches prepared statements per connection by query text, so every
+# helper call after the first reuses the prepared statement
+_SQL_INSERT_PROFILE = (
+    "INSERT INTO user_profiles (user_id, level, profile_data, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT DO NOTHING"
+)
+_SQL_INSERT_SESSION = (
+    "INSERT INTO sessions (id, user_id, started_at, status, topic_id) VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_INSERT_MARK = (
+    "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_INSERT_CORRECTION = (
+    "INSERT INTO corrections (session_id, segment_id, user_message, correction, explanation, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+@lru_cache
+def _sql_insert_segments(count: int) -> str:
+    """Multi-row segments INSERT for `count` turns, returning the new ids."""
+    return (
+        "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) VALUES "
+        + ", ".join(["(?, ?, ?, ?, ?)"] * count)
+        + " RETURNING id, turn_index"
+    )
+
+
+async def create_user_profile(user_id="u1"):
+    """Insert a user profile so get_or_create_profile doesn't hit NOT NULL constraint."""
+    db = await get_db()
+    await db.execute(_SQL_INSERT_PROFILE, (user_id, "intermediate", DEFAULT_PROFILE_JSON, NOW))
+
+
+async def insert_session_and_segments(session_id="s1", user_id="u1", turns=None, topic_id=None):
+    """Insert a session with segments. Returns {turn_index: segment_id}."""
+    if turns is None:
+        turns = DEFAULT_TURNS
+    db = await get_db()
+    await db.execute(_SQL_INSERT_SESSION, (session_id, user_id, NOW, "reviewing", topic_id))
+    params = []
+    for i, (user_text, ai_text) in enumerate(turns):
+        params += (session_id, i, user_text, ai_text, NOW)
+    rows = await db.execute_fetchall(_sql_insert_segments(len(turns)), params)
+    return {r["turn_index"]: r["id"] for r in rows}
+
+
+async def insert_session_with_marks(session_id="s1", user_id="u1"):
+    """Insert a profile and a session with segments, marks, and a correction."""
+    await create_user_profile(user_id)
+    seg_map = await insert_session_and_segments(session_id, user_id, turns=PAST_TENSE_TURNS)
+    db = await get_db()
+    await db.executemany(_SQL_INSERT_MARK, [
+        (seg_map[0], ISSUE_GRAMMAR, "I go to store yesterday",
+         "I went to the store yesterday", "過去式"),
+        (seg_map[1], ISSUE_GRAMMAR_NATURALNESS, "I buy some apple",
+         "I bought some apples", "過去式 + 可數名詞複數"),
+    ])
+    await db.execute(
+        _SQL_INSERT_CORRECTION,
+        (session_id, seg_map[0], "這句要怎麼說比較好", "I went to the store yesterday", "用過去式", NOW),
+    )
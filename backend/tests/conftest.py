@@ -0,0 +1,84 @@
+"""Shared fixtures for the DB-backed tests."""
+
+import os
+import sys
+from unittest.mock import AsyncMock
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+# Ensure backend root is on sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Patch settings before importing any app modules
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+ALL_TABLES = ["review_summaries", "chat_summaries", "session_summaries", "llm_cache",
+              "correction_cache", "corrections", "ai_marks", "segments", "user_profiles", "sessions"]
+_TRUNCATE_ALL = f"TRUNCATE {', '.join(ALL_TABLES)} CASCADE"
+
+
+async def _worker_database_url(test_url: str, worker: str) -> str:
+    """Point test_url at a per-worker copy of its database, creating it if needed.
+
+    Under pytest-xdist each worker truncates tables after every test, so
+    workers sharing one database would wipe each other's rows.
+    """
+    import asyncpg
+
+    parts = urlsplit(test_url)
+    name = f"{parts.path.lstrip('/') or 'postgres'}_{worker}"
+    conn = await asyncpg.connect(test_url)
+    try:
+        exists = await conn.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name)
+        if not exists:
+            await conn.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await conn.close()
+    return urlunsplit(parts._replace(path=f"/{name}"))
+
+
+@pytest.fixture(scope="session")
+async def db_pool():
+    """Connect to the test DB and create the schema once per test run (per xdist worker)."""
+    import config
+    test_url = os.environ.get("TEST_DATABASE_URL")
+    if not test_url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if worker:
+        test_url = await _worker_database_url(test_url, worker)
+    config.settings.DATABASE_URL = test_url
+    # Tests run one query at a time; don't open idle connections up front
+    config.settings.DB_POOL_MIN_SIZE = 1
+    # Test rows are thrown away; don't wait for the WAL flush on every commit
+    config.settings.DB_SYNCHRONOUS_COMMIT = "off"
+
+    import db as db_mod
+    await db_mod.init_db()
+    # Test rows are thrown away, so skip WAL for them. ALL_TABLES lists
+    # referencing tables first, as Postgres requires for SET UNLOGGED.
+    db = await db_mod.get_db()
+    for table in ALL_TABLES:
+        await db.execute(f"ALTER TABLE {table} SET UNLOGGED")
+    yield
+    await db_mod.close_db()
+
+
+@pytest.fixture
+async def clean_db(db_pool):
+    """Empty every table after the test in a single statement."""
+    yield
+    from db import get_db
+    db = await get_db()
+    await db.execute(_TRUNCATE_ALL)
+
+
+@pytest.fixture
+def mock_chat(monkeypatch):
+    """One AsyncMock standing in for chat_json in both review and profile."""
+    mock = AsyncMock()
+    monkeypatch.setattr("review.chat_json", mock)
+    monkeypatch.setattr("profile.chat_json", mock)
+    return mock
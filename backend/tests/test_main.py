@@ -0,0 +1,107 @@
+"""Tests for main.py endpoints — GET /sessions/{id}/review/wait."""
+
+import asyncio
+import sys
+import os
+
+import httpx
+import pytest
+
+# Ensure backend root is on sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Patch settings before importing any app modules
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from constants import SessionStatus
+from db import get_db
+from tests._fixtures import NOW
+import main
+import sessions
+
+
+@pytest.fixture(autouse=True)
+def setup_db(clean_db):
+    """Every test here runs against the shared test DB, emptied afterwards."""
+
+
+@pytest.fixture
+async def client():
+    # No lifespan: the DB pool comes from the db_pool fixture
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+async def _insert_session(session_id: str, status: str):
+    db = await get_db()
+    await db.execute(
+        "INSERT INTO sessions (id, user_id, started_at, status) VALUES (?, ?, ?, ?)",
+        (session_id, "u1", NOW, status),
+    )
+
+
+async def _set_status(session_id: str, status: str):
+    """Mimic a background task finishing: write the status, then notify."""
+    db = await get_db()
+    await db.execute("UPDATE sessions SET status = ? WHERE id = ?", (status, session_id))
+    sessions.notify_status_change(session_id)
+
+
+@pytest.mark.asyncio
+async def test_review_wait_unknown_session_404(client):
+    """Unknown session → 404, and no status event is left behind."""
+    resp = await client.get("/sessions/missing/review/wait", params={"timeout": 5})
+
+    assert resp.status_code == 404
+    assert "missing" not in sessions._status_events
+
+
+@pytest.mark.asyncio
+async def test_review_wait_returns_immediately_when_done(client):
+    """A session that isn't reviewing/completing is returned without waiting."""
+    await _insert_session("done", SessionStatus.COMPLETED)
+
+    resp = await asyncio.wait_for(
+        client.get("/sessions/done/review/wait", params={"timeout": 30}), 2
+    )
+
+    assert resp.status_code == 200
+    assert resp.json()["status"] == SessionStatus.COMPLETED
+    assert "done" not in sessions._status_events
+
+
+@pytest.mark.asyncio
+async def test_review_wait_rechecks_status_after_wake(client):
+    """Woken by REVIEWED while completing → re-checks and keeps waiting until completed."""
+    await _insert_session("s1", SessionStatus.COMPLETING)
+
+    request = asyncio.create_task(
+        client.get("/sessions/s1/review/wait", params={"timeout": 5})
+    )
+    await asyncio.sleep(0.1)
+
+    # _run_review finishing while /end's finalize step is still running
+    await _set_status("s1", SessionStatus.REVIEWED)
+    await asyncio.sleep(0.1)
+    assert not request.done()
+
+    await _set_status("s1", SessionStatus.COMPLETED)
+    resp = await asyncio.wait_for(request, 2)
+
+    assert resp.json()["status"] == SessionStatus.COMPLETED
+    assert "s1" not in sessions._status_events
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("timeout", ["nan", "-1", "61"])
+async def test_review_wait_rejects_out_of_range_timeout(client, timeout):
+    """timeout must be a number within [0, MAX_REVIEW_WAIT_SECONDS]; NaN included."""
+    await _insert_session("s1", SessionStatus.REVIEWING)
+
+    resp = await asyncio.wait_for(
+        client.get("/sessions/s1/review/wait", params={"timeout": timeout}), 2
+    )
+
+    assert resp.status_code == 422
+    assert "s1" not in sessions._status_events
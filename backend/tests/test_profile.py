@@ -1,10 +1,9 @@
 """Tests for profile.py — update_profile_after_session, get_or_create_profile."""
 
+import asyncio
 import json
 import sys
 import os
-from datetime import datetime, timezone
-from unittest.mock import AsyncMock, patch
 
 import pytest
 
@@ -14,115 +13,109 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 # Patch settings before importing any app modules
 os.environ.setdefault("OPENAI_API_KEY", "test-key")
 
-from db import init_db, close_db, get_db
+from db import get_db
+from tests._fixtures import NOW, create_user_profile, insert_session_with_marks
 import profile
 
 
-ALL_TABLES = ["review_summaries", "chat_summaries", "session_summaries",
-              "corrections", "ai_marks", "segments", "user_profiles", "sessions"]
+@pytest.fixture(autouse=True)
+def setup_db(clean_db):
+    """Every test here runs against the shared test DB, emptied afterwards."""
 
 
-@pytest.fixture(autouse=True)
-async def setup_db():
-    """Connect to test Supabase DB, truncate all tables after each test."""
-    import config
-    test_url = os.environ.get("TEST_DATABASE_URL")
-    if not test_url:
-        pytest.skip("TEST_DATABASE_URL not set")
-    config.settings.DATABASE_URL = test_url
-
-    import db as db_mod
-    db_mod._pool = None
-    db_mod._db = None
-    await init_db()
-    yield
-    # Truncate all tables
-    db = await get_db()
-    for table in ALL_TABLES:
-        await db.execute(f"TRUNCATE {table} CASCADE")
-    await close_db()
+@pytest.mark.asyncio
+async def test_get_or_create_profile_default():
+    """Default profile has expected fields including progress_notes."""
+    result = await profile.get_or_create_profile("new_user")
+    assert result["learning_goal"] is None
 
+    data = result["profile_data"]
+    assert set(data.keys()) == {"personal_facts", "weak_points", "common_errors", "progress_notes", "quick_review"}
+    assert data["personal_facts"] == []
+    assert data["common_errors"] == []
+    assert data["progress_notes"] == ""
+    assert data["quick_review"] == []
+    assert set(data["weak_points"].keys()) == {"grammar", "naturalness", "sentence_structure"}
 
-async def _create_user_profile(user_id="u1"):
-    """Helper to insert a user profile so get_or_create_profile doesn't hit NOT NULL constraint."""
+
+@pytest.mark.asyncio
+async def test_get_or_create_profile_normalizes_legacy_weak_points():
+    """String patterns from older profiles are loaded as pattern objects."""
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
-    default_data = {
+    legacy_data = {
         "personal_facts": [],
-        "weak_points": {"grammar": [], "naturalness": [], "sentence_structure": []},
+        "weak_points": {
+            "grammar": ["過去式混用為現在式"],
+            "naturalness": [{"pattern": "用詞偏基礎"}],
+            "sentence_structure": [],
+        },
         "common_errors": [],
     }
     await db.execute(
-        "INSERT INTO user_profiles (user_id, level, profile_data, updated_at) VALUES (?, ?, ?, ?) "
-        "ON CONFLICT DO NOTHING",
-        (user_id, "intermediate", json.dumps(default_data), now),
+        "INSERT INTO user_profiles (user_id, level, profile_data, updated_at) VALUES (?, ?, ?, ?)",
+        ("legacy", "intermediate", json.dumps(legacy_data), NOW),
     )
     await db.commit()
 
+    result = await profile.get_or_create_profile("legacy")
+
+    weak_points = result["profile_data"]["weak_points"]
+    assert weak_points["grammar"] == [{"pattern": "過去式混用為現在式", "examples": []}]
+    assert weak_points["naturalness"] == [{"pattern": "用詞偏基礎", "examples": []}]
+    assert weak_points["sentence_structure"] == []
+
 
-async def _insert_session_with_marks(session_id="s1", user_id="u1"):
-    """Helper to insert a session with segments, marks, and corrections."""
-    await _create_user_profile(user_id)
+@pytest.mark.asyncio
+async def test_get_or_create_profile_keeps_flat_list_weak_points():
+    """A legacy flat weak_points list carries no dimension, so it is kept as stored."""
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
-    await db.execute(
-        "INSERT INTO sessions (id, user_id, started_at, status) VALUES (?, ?, ?, ?)",
-        (session_id, user_id, now, "reviewing"),
-    )
-    # Insert segments
-    await db.execute(
-        "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (session_id, 0, "I go to store yesterday", "Oh, what did you buy?", now),
-    )
+    legacy_data = {
+        "personal_facts": [],
+        "weak_points": ["過去式混用為現在式"],
+        "common_errors": [],
+    }
     await db.execute(
-        "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (session_id, 1, "I buy some apple", "Sounds great!", now),
+        "INSERT INTO user_profiles (user_id, level, profile_data, updated_at) VALUES (?, ?, ?, ?)",
+        ("legacy", "intermediate", json.dumps(legacy_data), NOW),
     )
 
-    # Get segment IDs
-    rows = await db.execute_fetchall(
-        "SELECT id, turn_index FROM segments WHERE session_id = ?", (session_id,)
-    )
-    seg_map = {r["turn_index"]: r["id"] for r in rows}
+    result = await profile.get_or_create_profile("legacy")
 
-    # Insert AI marks
-    await db.execute(
-        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (seg_map[0], '["grammar"]', "I go to store yesterday",
-         "I went to the store yesterday", "過去式"),
-    )
-    await db.execute(
-        "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (seg_map[1], '["grammar", "naturalness"]', "I buy some apple",
-         "I bought some apples", "過去式 + 可數名詞複數"),
-    )
+    assert result["profile_data"]["weak_points"] == ["過去式混用為現在式"]
 
-    # Insert a correction
+
+@pytest.mark.asyncio
+async def test_get_or_create_profile_passes_through_unrecognised_weak_points():
+    """Null examples become [], while extra keys and odd entries survive untouched."""
+    db = await get_db()
+    odd_data = {
+        "personal_facts": [],
+        "weak_points": {
+            "grammar": [
+                {"pattern": "冠詞遺漏", "examples": None},
+                {"pattern": "時態", "examples": [{"wrong": "I go", "correct": "I went", "note": "past"}, "raw"],
+                 "since": "2024-01-01"},
+                42,
+            ],
+        },
+        "common_errors": [],
+    }
     await db.execute(
-        "INSERT INTO corrections (session_id, segment_id, user_message, correction, explanation, created_at) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (session_id, seg_map[0], "這句要怎麼說比較好", "I went to the store yesterday", "用過去式", now),
+        "INSERT INTO user_profiles (user_id, level, profile_data, updated_at) VALUES (?, ?, ?, ?)",
+        ("odd", "intermediate", json.dumps(odd_data), NOW),
     )
-    await db.commit()
-
 
-@pytest.mark.asyncio
-async def test_get_or_create_profile_default():
-    """Default profile has expected fields including progress_notes."""
-    result = await profile.get_or_create_profile("new_user")
-    assert result["learning_goal"] is None
+    result = await profile.get_or_create_profile("odd")
 
-    data = result["profile_data"]
-    assert set(data.keys()) == {"personal_facts", "weak_points", "common_errors", "progress_notes", "quick_review"}
-    assert data["personal_facts"] == []
-    assert data["common_errors"] == []
-    assert data["progress_notes"] == ""
-    assert data["quick_review"] == []
-    assert set(data["weak_points"].keys()) == {"grammar", "naturalness", "sentence_structure"}
+    assert result["profile_data"]["weak_points"] == {
+        "grammar": [
+            {"pattern": "冠詞遺漏", "examples": []},
+            {"pattern": "時態", "examples": [{"wrong": "I go", "correct": "I went", "note": "past"}, "raw"],
+             "since": "2024-01-01"},
+            42,
+        ],
+    }
+    assert profile.compute_needs_review(result["profile_data"]) is False
 
 
 @pytest.mark.asyncio
@@ -137,7 +130,6 @@ async def test_update_learning_goal_nullable():
 
 
 @pytest.mark.asyncio
-@patch("profile.chat_json", new_callable=AsyncMock)
 async def test_update_profile_only_sends_transcript_marks_corrections(mock_chat):
     """update_profile_after_session sends only transcript, marks, corrections — no session_summary."""
     mock_chat.return_value = {
@@ -148,7 +140,7 @@ async def test_update_profile_only_sends_transcript_marks_corrections(mock_chat)
         }
     }
 
-    await _insert_session_with_marks()
+    await insert_session_with_marks()
     await profile.update_profile_after_session("u1", "s1")
 
     mock_chat.assert_called_once()
@@ -173,7 +165,6 @@ async def test_update_profile_only_sends_transcript_marks_corrections(mock_chat)
 
 
 @pytest.mark.asyncio
-@patch("profile.chat_json", new_callable=AsyncMock)
 async def test_update_profile_sends_profile_data_only(mock_chat):
     """The prompt sends only profile_data, not the full profile (user_id, level, etc.)."""
     mock_chat.return_value = {
@@ -184,7 +175,7 @@ async def test_update_profile_sends_profile_data_only(mock_chat):
         }
     }
 
-    await _insert_session_with_marks()
+    await insert_session_with_marks()
     await profile.update_profile_after_session("u1", "s1")
 
     _, user_msg = mock_chat.call_args[0]
@@ -196,7 +187,6 @@ async def test_update_profile_sends_profile_data_only(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("profile.chat_json", new_callable=AsyncMock)
 async def test_update_profile_output_has_3_fields(mock_chat):
     """Output profile_data stored in DB has exactly 3 fields."""
     mock_chat.return_value = {
@@ -218,7 +208,7 @@ async def test_update_profile_output_has_3_fields(mock_chat):
         }
     }
 
-    await _insert_session_with_marks()
+    await insert_session_with_marks()
     result = await profile.update_profile_after_session("u1", "s1")
 
     data = result["profile_data"]
@@ -264,39 +254,36 @@ async def test_compute_needs_review():
 
 
 @pytest.mark.asyncio
-@patch("profile.chat_json", new_callable=AsyncMock)
 async def test_generate_progress_notes(mock_chat):
     """generate_progress_notes queries session + review summaries and updates profile."""
     mock_chat.return_value = {
         "progress_notes": "你最近練習了日常對話，過去式的使用有明顯進步。建議加強自然度。"
     }
 
-    await _create_user_profile("u2")
+    await create_user_profile("u2")
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
-
-    # Insert a conversation session with summary
-    await db.execute(
-        "INSERT INTO sessions (id, user_id, started_at, status, mode) VALUES (?, ?, ?, ?, ?)",
-        ("s10", "u2", now, "completed", "conversation"),
-    )
-    await db.execute(
-        "INSERT INTO session_summaries (session_id, user_id, strengths, weaknesses, overall, created_at) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        ("s10", "u2", '["Good vocabulary"]', '{"grammar": "Tense errors"}', "Making progress", now),
-    )
 
-    # Insert a review session with summary
-    await db.execute(
+    # A conversation session and a review session, each with its summary
+    await db.executemany(
         "INSERT INTO sessions (id, user_id, started_at, status, mode) VALUES (?, ?, ?, ?, ?)",
-        ("s11", "u2", now, "ended", "review"),
+        [
+            ("s10", "u2", NOW, "completed", "conversation"),
+            ("s11", "u2", NOW, "ended", "review"),
+        ],
     )
-    await db.execute(
-        "INSERT INTO review_summaries (session_id, user_id, practiced, notes, created_at) "
-        "VALUES (?, ?, ?, ?, ?)",
-        ("s11", "u2", "Past tense drills", "Improved accuracy", now),
+    # Independent tables, so the two summary inserts run concurrently on the pool
+    await asyncio.gather(
+        db.execute(
+            "INSERT INTO session_summaries (session_id, user_id, strengths, weaknesses, overall, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ("s10", "u2", '["Good vocabulary"]', '{"grammar": "Tense errors"}', "Making progress", NOW),
+        ),
+        db.execute(
+            "INSERT INTO review_summaries (session_id, user_id, practiced, notes, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            ("s11", "u2", "Past tense drills", "Improved accuracy", NOW),
+        ),
     )
-    await db.commit()
 
     result = await profile.generate_progress_notes("u2")
 
@@ -319,7 +306,6 @@ async def test_generate_progress_notes(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("profile.chat_json", new_callable=AsyncMock)
 async def test_generate_quick_review(mock_chat):
     """generate_quick_review queries corrections + ai_marks and sends them to LLM."""
     mock_chat.return_value = {
@@ -329,7 +315,7 @@ async def test_generate_quick_review(mock_chat):
         ]
     }
 
-    await _insert_session_with_marks(session_id="s20", user_id="u3")
+    await insert_session_with_marks(session_id="s20", user_id="u3")
 
     # Set session mode to conversation (required for query)
     db = await get_db()
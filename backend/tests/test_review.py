@@ -3,7 +3,6 @@
 import json
 import sys
 import os
-from datetime import datetime, timezone
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -14,61 +13,27 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 # Patch settings before importing any app modules
 os.environ.setdefault("OPENAI_API_KEY", "test-key")
 
-from db import init_db, close_db, get_db
+from db import get_db
+from tests._fixtures import ISSUE_GRAMMAR, ISSUE_GRAMMAR_NATURALNESS, NOW, insert_session_and_segments
 import review
 
 
-ALL_TABLES = ["review_summaries", "chat_summaries", "session_summaries",
-              "corrections", "ai_marks", "segments", "user_profiles", "sessions"]
-
-
 @pytest.fixture(autouse=True)
-async def setup_db():
-    """Connect to test Supabase DB, truncate all tables after each test."""
-    import config
-    test_url = os.environ.get("TEST_DATABASE_URL")
-    if not test_url:
-        pytest.skip("TEST_DATABASE_URL not set")
-    config.settings.DATABASE_URL = test_url
-
-    import db as db_mod
-    db_mod._pool = None
-    db_mod._db = None
-    await init_db()
-    yield
-    # Truncate all tables
-    db = await get_db()
-    for table in ALL_TABLES:
-        await db.execute(f"TRUNCATE {table} CASCADE")
-    await close_db()
+def setup_db(clean_db):
+    """Every test here runs against the shared test DB, emptied afterwards."""
 
 
-async def _insert_session_and_segments(session_id="s1", user_id="u1", turns=None, topic_id=None):
-    """Helper to insert a session with segments."""
-    db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
-    await db.execute(
-        "INSERT INTO sessions (id, user_id, started_at, status, topic_id) VALUES (?, ?, ?, ?, ?)",
-        (session_id, user_id, now, "reviewing", topic_id),
-    )
-    if turns is None:
-        turns = [
-            ("How's your day?", "It's going well! How about you?"),
-            ("The weather, I think good", "That's great to hear! The weather has been lovely."),
-        ]
-    for i, (user_text, ai_text) in enumerate(turns):
-        await db.execute(
-            "INSERT INTO segments (session_id, turn_index, user_text, ai_text, created_at) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (session_id, i, user_text, ai_text, now),
-        )
-    await db.commit()
+@pytest.fixture(autouse=True)
+def mock_embed():
+    """Stub the embeddings call used by the correction cache."""
+    with patch("review.embed", new_callable=AsyncMock) as mock:
+        mock.return_value = [1.0, 0.0, 0.0]
+        yield mock
 
 
 # --- generate_review tests ---
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_review_writes_marks(mock_chat):
     """AI marks are written to DB from well-formed LLM response."""
     mock_chat.return_value = {
@@ -83,9 +48,11 @@ async def test_generate_review_writes_marks(mock_chat):
         ]
     }
 
-    await _insert_session_and_segments()
+    await insert_session_and_segments()
     await review.generate_review("s1")
 
+    assert mock_chat.call_args.kwargs["json_schema"] is review.REVIEW_MARKS_SCHEMA
+
     db = await get_db()
     marks = await db.execute_fetchall("SELECT * FROM ai_marks")
     assert len(marks) == 1
@@ -95,7 +62,42 @@ async def test_generate_review_writes_marks(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
+async def test_generate_review_writes_all_marks_in_batch(mock_chat):
+    """Every well-formed mark is written, one row per mark."""
+    mock_chat.return_value = {
+        "marks": [
+            {
+                "turn_index": 0,
+                "issue_types": ["naturalness"],
+                "original": "How's your day?",
+                "suggestion": "How's your day going?",
+                "explanation": "加上 going 更口語",
+            },
+            {
+                "turn_index": 1,
+                "issue_types": ["grammar"],
+                "original": "The weather, I think good",
+                "suggestion": "I think the weather is good",
+                "explanation": "需要加 is",
+            },
+        ]
+    }
+
+    await insert_session_and_segments()
+    await review.generate_review("s1")
+
+    db = await get_db()
+    marks = await db.execute_fetchall(
+        "SELECT s.turn_index, m.original FROM ai_marks m JOIN segments s ON m.segment_id = s.id "
+        "ORDER BY s.turn_index"
+    )
+    assert [(m["turn_index"], m["original"]) for m in marks] == [
+        (0, "How's your day?"),
+        (1, "The weather, I think good"),
+    ]
+
+
+@pytest.mark.asyncio
 async def test_generate_review_skips_malformed_marks(mock_chat):
     """Marks missing required fields are skipped, not crash."""
     mock_chat.return_value = {
@@ -117,7 +119,7 @@ async def test_generate_review_skips_malformed_marks(mock_chat):
         ]
     }
 
-    await _insert_session_and_segments()
+    await insert_session_and_segments()
     await review.generate_review("s1")
 
     db = await get_db()
@@ -126,14 +128,12 @@ async def test_generate_review_skips_malformed_marks(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_review_no_segments(mock_chat):
     """No segments → no crash, no LLM call."""
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
     await db.execute(
         "INSERT INTO sessions (id, user_id, started_at, status) VALUES (?, ?, ?, ?)",
-        ("empty", "u1", now, "reviewing"),
+        ("empty", "u1", NOW, "reviewing"),
     )
     await db.commit()
 
@@ -142,7 +142,6 @@ async def test_generate_review_no_segments(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_review_unknown_turn_index(mock_chat):
     """LLM returns a turn_index that doesn't exist → skipped gracefully."""
     mock_chat.return_value = {
@@ -157,7 +156,7 @@ async def test_generate_review_unknown_turn_index(mock_chat):
         ]
     }
 
-    await _insert_session_and_segments()
+    await insert_session_and_segments()
     await review.generate_review("s1")
 
     db = await get_db()
@@ -168,7 +167,6 @@ async def test_generate_review_unknown_turn_index(mock_chat):
 # --- generate_correction tests ---
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_correction_success(mock_chat):
     """Correction is returned and stored in DB."""
     mock_chat.return_value = {
@@ -176,14 +174,8 @@ async def test_generate_correction_success(mock_chat):
         "explanation": "可以用 nice 代替 good 來形容天氣",
     }
 
-    await _insert_session_and_segments()
-
-    # Get the segment_id for turn 1
+    seg_id = (await insert_session_and_segments())[1]
     db = await get_db()
-    rows = await db.execute_fetchall(
-        "SELECT id FROM segments WHERE session_id = 's1' AND turn_index = 1"
-    )
-    seg_id = rows[0]["id"]
 
     result = await review.generate_correction("s1", seg_id, "這句我想說天氣很好但不知道怎麼講")
 
@@ -198,7 +190,6 @@ async def test_generate_correction_success(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_correction_includes_ai_marks_in_prompt_context(mock_chat):
     """Correction prompt includes current segment's AI marks for grounding."""
     mock_chat.return_value = {
@@ -206,19 +197,14 @@ async def test_generate_correction_includes_ai_marks_in_prompt_context(mock_chat
         "explanation": "這裡要補 be 動詞；也可以用 pretty nice 讓語氣更自然。",
     }
 
-    await _insert_session_and_segments()
-
+    seg_id = (await insert_session_and_segments())[1]
     db = await get_db()
-    rows = await db.execute_fetchall(
-        "SELECT id FROM segments WHERE session_id = 's1' AND turn_index = 1"
-    )
-    seg_id = rows[0]["id"]
     await db.execute(
         "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
         "VALUES (?, ?, ?, ?, ?)",
         (
             seg_id,
-            json.dumps(["grammar", "naturalness"], ensure_ascii=False),
+            ISSUE_GRAMMAR_NATURALNESS,
             "The weather, I think good",
             "I think the weather is pretty nice today.",
             "缺少 be 動詞，且 good 可改為 pretty nice 更自然。",
@@ -236,10 +222,9 @@ async def test_generate_correction_includes_ai_marks_in_prompt_context(mock_chat
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_correction_invalid_segment(mock_chat):
     """Non-existent segment raises ValueError."""
-    await _insert_session_and_segments()
+    await insert_session_and_segments()
 
     with pytest.raises(ValueError, match="Segment 9999 not found"):
         await review.generate_correction("s1", 9999, "help")
@@ -247,10 +232,46 @@ async def test_generate_correction_invalid_segment(mock_chat):
     mock_chat.assert_not_called()
 
 
+@pytest.mark.asyncio
+async def test_generate_correction_reuses_cached_answer_for_similar_question(mock_chat, mock_embed):
+    """A near-identical follow-up on the same segment is served from the cache."""
+    mock_chat.return_value = {
+        "correction": "I think the weather is really nice today",
+        "explanation": "可以用 nice 代替 good 來形容天氣",
+    }
+
+    seg_id = (await insert_session_and_segments())[1]
+    db = await get_db()
+
+    await review.generate_correction("s1", seg_id, "這句怎麼說比較好？")
+    mock_embed.return_value = [0.99, 0.05, 0.0]
+    result = await review.generate_correction("s1", seg_id, "這句要怎麼說比較好")
+
+    mock_chat.assert_called_once()
+    assert result["correction"] == "I think the weather is really nice today"
+
+    corrections = await db.execute_fetchall("SELECT * FROM corrections")
+    assert len(corrections) == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_correction_calls_llm_for_different_question(mock_chat, mock_embed):
+    """A dissimilar question on the same segment misses the cache."""
+    mock_chat.return_value = {"correction": "c", "explanation": "e"}
+
+    seg_id = (await insert_session_and_segments())[1]
+    db = await get_db()
+
+    await review.generate_correction("s1", seg_id, "這句怎麼說比較好？")
+    mock_embed.return_value = [0.0, 1.0, 0.0]
+    await review.generate_correction("s1", seg_id, "good 和 nice 差在哪？")
+
+    assert mock_chat.call_count == 2
+
+
 # --- generate_session_review tests ---
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_session_review_success(mock_chat):
     """Final review is returned and stored in session_summaries."""
     mock_chat.return_value = {
@@ -263,18 +284,14 @@ async def test_generate_session_review_success(mock_chat):
         "overall": "學習者能參與基本對話，但語法和自然度需要加強。",
     }
 
-    await _insert_session_and_segments()
+    seg_id = (await insert_session_and_segments())[1]
 
     # Pre-insert some AI marks
     db = await get_db()
-    rows = await db.execute_fetchall(
-        "SELECT id FROM segments WHERE session_id = 's1' AND turn_index = 1"
-    )
-    seg_id = rows[0]["id"]
     await db.execute(
         "INSERT INTO ai_marks (segment_id, issue_types, original, suggestion, explanation) "
         "VALUES (?, ?, ?, ?, ?)",
-        (seg_id, '["grammar"]', "I think good", "I think it is good", "缺少 be 動詞"),
+        (seg_id, ISSUE_GRAMMAR, "I think good", "I think it is good", "缺少 be 動詞"),
     )
     await db.commit()
 
@@ -290,17 +307,30 @@ async def test_generate_session_review_success(mock_chat):
     assert json.loads(summary[0]["weaknesses"])["grammar"] is not None
 
 
+@pytest.mark.asyncio
+async def test_generate_session_review_empty_rows_skips_queries(mock_chat, monkeypatch):
+    """Preloaded empty rows → None before any marks/corrections query or LLM call."""
+    db = await get_db()
+    fetchall = AsyncMock()
+    monkeypatch.setattr(db, "execute_fetchall", fetchall)
+
+    result = await review.generate_session_review("s1", "u1", rows=[])
+
+    assert result is None
+    fetchall.assert_not_called()
+    mock_chat.assert_not_called()
+
+
 # --- generate_chat_summary tests ---
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_chat_summary_success(mock_chat):
     """Chat summary is generated and stored in chat_summaries table."""
     mock_chat.return_value = {
         "summary": "Discussed favorite weekend activities. The learner shared they enjoy hiking and cooking."
     }
 
-    await _insert_session_and_segments(topic_id="weekend")
+    await insert_session_and_segments(topic_id="weekend")
 
     result = await review.generate_chat_summary("s1", "weekend")
 
@@ -316,14 +346,74 @@ async def test_generate_chat_summary_success(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
+async def test_generate_chat_summary_rerun_uses_cache(mock_chat):
+    """Re-running on an unchanged transcript returns the cached response without an LLM call."""
+    mock_chat.return_value = {"summary": "Discussed the weather."}
+
+    await insert_session_and_segments(topic_id="weekend")
+
+    await review.generate_chat_summary("s1", "weekend")
+    result = await review.generate_chat_summary("s1", "weekend")
+
+    assert result["summary"] == "Discussed the weather."
+    mock_chat.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_chat_summary_cache_keyed_on_model(mock_chat, monkeypatch):
+    """Switching CHAT_MODEL misses entries cached for the previous model."""
+    mock_chat.return_value = {"summary": "Discussed the weather."}
+
+    await insert_session_and_segments(topic_id="weekend")
+
+    await review.generate_chat_summary("s1", "weekend")
+    monkeypatch.setattr(review.settings, "CHAT_MODEL", "another-model")
+    await review.generate_chat_summary("s1", "weekend")
+
+    assert mock_chat.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_write_purges_expired_entries(mock_chat):
+    """Writing a cache entry deletes entries older than the TTL."""
+    mock_chat.return_value = {"summary": "Discussed the weather."}
+
+    await insert_session_and_segments(topic_id="weekend")
+    db = await get_db()
+    await db.execute(
+        "INSERT INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+        ("stale", "{}", NOW),
+    )
+
+    await review.generate_chat_summary("s1", "weekend")
+
+    keys = [r["key"] for r in await db.execute_fetchall("SELECT key FROM llm_cache")]
+    assert len(keys) == 1
+    assert "stale" not in keys
+
+
+@pytest.mark.asyncio
+async def test_generate_chat_summary_with_preloaded_rows(mock_chat):
+    """Rows from load_transcript are used as the transcript."""
+    mock_chat.return_value = {"summary": "Discussed the weather."}
+
+    await insert_session_and_segments(topic_id="weekend")
+    db = await get_db()
+    rows = await review.load_transcript(db, "s1")
+
+    await review.generate_chat_summary("s1", "weekend", rows=rows)
+
+    _, transcript = mock_chat.call_args.args
+    assert transcript.startswith("Turn 0:\n  User: How's your day?")
+
+
+@pytest.mark.asyncio
 async def test_generate_chat_summary_no_segments(mock_chat):
     """No segments → no LLM call, returns empty summary."""
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
     await db.execute(
         "INSERT INTO sessions (id, user_id, started_at, status, topic_id) VALUES (?, ?, ?, ?, ?)",
-        ("empty", "u1", now, "reviewing", "weekend"),
+        ("empty", "u1", NOW, "reviewing", "weekend"),
     )
     await db.commit()
 
@@ -336,7 +426,6 @@ async def test_generate_chat_summary_no_segments(mock_chat):
 # --- generate_review_summary tests ---
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_review_summary_success(mock_chat):
     """Review summary is generated and stored in review_summaries table."""
     mock_chat.return_value = {
@@ -350,7 +439,7 @@ async def test_generate_review_summary_success(mock_chat):
         "notes": "本次練習了過去式的使用，學習者大部分能正確回答，表現有進步。",
     }
 
-    await _insert_session_and_segments(session_id="r1", user_id="u1")
+    await insert_session_and_segments(session_id="r1", user_id="u1")
 
     result = await review.generate_review_summary("r1", "u1")
 
@@ -372,14 +461,12 @@ async def test_generate_review_summary_success(mock_chat):
 
 
 @pytest.mark.asyncio
-@patch("review.chat_json", new_callable=AsyncMock)
 async def test_generate_review_summary_no_segments(mock_chat):
     """No segments → return None, no LLM call."""
     db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
     await db.execute(
         "INSERT INTO sessions (id, user_id, started_at, status, mode) VALUES (?, ?, ?, ?, ?)",
-        ("empty_review", "u1", now, "ended", "review"),
+        ("empty_review", "u1", NOW, "ended", "review"),
     )
     await db.commit()
 
@@ -0,0 +1,180 @@
+"""Tests for sessions.py — background persist/connect on create, cancellation on delete."""
+
+import asyncio
+import sys
+import os
+from unittest.mock import AsyncMock
+
+import pytest
+
+# Ensure backend root is on sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Patch settings before importing any app modules
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from constants import SessionMode
+from db import get_db
+import sessions
+
+
+class FakeRealtimeSession:
+    """Stands in for RealtimeSession; connect() runs the behaviour under test."""
+
+    connect_impl = None
+
+    def __init__(self, session_id, **kwargs):
+        self.session_id = session_id
+        self.connect_calls = 0
+        self.close_calls = 0
+
+    async def connect(self):
+        self.connect_calls += 1
+        await type(self).connect_impl(self)
+
+    async def close(self):
+        self.close_calls += 1
+
+
+@pytest.fixture(autouse=True)
+def setup_db(clean_db, monkeypatch):
+    """Shared test DB plus a stubbed Realtime session; no backoff between retries."""
+    monkeypatch.setattr(sessions, "RealtimeSession", FakeRealtimeSession)
+    monkeypatch.setattr(sessions, "CONNECT_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(sessions, "_run_review", AsyncMock())
+    yield
+    sessions._sessions.clear()
+
+
+def _connect_with(impl):
+    FakeRealtimeSession.connect_impl = staticmethod(impl)
+
+
+async def _create():
+    result = await sessions.create_session("u1", mode=SessionMode.CONVERSATION)
+    session_id = result["session_id"]
+    return session_id, sessions._sessions[session_id]
+
+
+@pytest.mark.asyncio
+async def test_persist_failure_evicts_session(monkeypatch):
+    """A failed sessions INSERT evicts the entry and never connects."""
+    monkeypatch.setattr(sessions, "_persist_session", AsyncMock(side_effect=RuntimeError("db down")))
+    _connect_with(AsyncMock())
+
+    session_id, entry = await _create()
+    await entry.connect_task
+
+    assert session_id not in sessions._sessions
+    assert entry.session.connect_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_during_connect_cancels_connect_not_insert():
+    """delete_session cancels a pending connect, but the sessions row still lands."""
+    connecting = asyncio.Event()
+
+    async def hang(session):
+        connecting.set()
+        await asyncio.Event().wait()
+
+    _connect_with(hang)
+
+    session_id, entry = await _create()
+    await connecting.wait()
+    result = await sessions.delete_session(session_id)
+
+    assert result["session_id"] == session_id
+    assert entry.connect_task.cancelled()
+    assert entry.session.close_calls == 1
+
+    db = await get_db()
+    rows = await db.execute_fetchall("SELECT status FROM sessions WHERE id = ?", (session_id,))
+    assert rows[0]["status"] == "reviewing"
+
+
+@pytest.mark.asyncio
+async def test_connect_retries_after_failure():
+    """A failed connect attempt is closed and retried; success keeps the session."""
+    async def fail_once(session):
+        if session.connect_calls == 1:
+            raise ConnectionError("transient")
+
+    _connect_with(fail_once)
+
+    session_id, entry = await _create()
+    await entry.connect_task
+
+    assert entry.session.connect_calls == 2
+    assert entry.session.close_calls == 1
+    assert sessions._sessions[session_id] is entry
+
+
+@pytest.mark.asyncio
+async def test_close_clears_connected_event():
+    """Closing after a half-finished connect leaves the session not connected."""
+    from providers.openai_s2s import RealtimeSession
+
+    session = RealtimeSession("s1", mode=SessionMode.CONVERSATION, profile={}, topic=None)
+    session._connected_event.set()
+    await session.close()
+
+    assert not await session.wait_until_connected(timeout=0.01)
+
+
+def test_build_weak_points_for_review_caps_and_skips_odd_shapes(monkeypatch):
+    """Patterns/examples are capped by settings; shapes normalization passed through are skipped."""
+    monkeypatch.setattr(sessions.settings, "MAX_PATTERNS_FOR_REVIEW", 2)
+    monkeypatch.setattr(sessions.settings, "MAX_EXAMPLES_FOR_REVIEW", 1)
+    profile = {"profile_data": {"weak_points": {
+        "grammar": [
+            {"pattern": "時態", "examples": [{"wrong": "I go", "correct": "I went"}, {"wrong": "a", "correct": "b"}]},
+            42,
+            {"pattern": "冠詞", "examples": ["raw"]},
+        ],
+        "naturalness": "not a list",
+    }}}
+
+    assert sessions._build_weak_points_for_review(profile) == (
+        '- [Grammar] 時態\n  Wrong: "I go" → Correct: "I went"'
+    )
+    assert sessions._build_weak_points_for_review({"profile_data": {"weak_points": ["flat"]}}) == ""
+
+
+@pytest.mark.asyncio
+async def test_close_after_failed_connect_resets_event_queue():
+    """A connect that fails after the listener started leaves nothing queued for the retry."""
+    from types import SimpleNamespace
+    from providers.openai_s2s import RealtimeSession
+
+    class FailingConn:
+        session = SimpleNamespace(update=AsyncMock())
+        recv = AsyncMock(return_value=SimpleNamespace(type="session.updated"))
+        close = AsyncMock()
+
+        def __init__(self):
+            self.response = SimpleNamespace(create=self._create)
+
+        async def _create(self):
+            # Let the listener queue its events before the greeting request fails
+            for _ in range(3):
+                await asyncio.sleep(0)
+            raise ConnectionError("response.create failed")
+
+        async def __aiter__(self):
+            yield SimpleNamespace(type="response.created")
+            raise ConnectionError("socket dropped")
+
+    conn = FailingConn()
+    client = SimpleNamespace(beta=SimpleNamespace(realtime=SimpleNamespace(
+        connect=lambda **kwargs: SimpleNamespace(enter=AsyncMock(return_value=conn)))))
+    session = RealtimeSession("s1", mode=SessionMode.CONVERSATION, profile={}, topic=None)
+    session._client = client
+
+    with pytest.raises(ConnectionError):
+        await session.connect()
+    assert session._event_queue.qsize() == 2  # the stray event and the sentinel
+    await session.close()
+
+    assert session._event_queue.empty()
+    assert session._listener_task is None
@@ -0,0 +1,17 @@
+"""Tests for tools.py — execute_tool."""
+
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tools import execute_tool
+
+
+def test_search_news_accepts_non_string_query():
+    """A malformed (unhashable) query from the model still returns results."""
+    articles = json.loads(execute_tool("search_news", {"query": ["a"]}))
+
+    assert len(articles) == 2
+    assert "['a']" in articles[0]["title"]
@@ -1,4 +1,5 @@
 import json
+from functools import lru_cache
 
 TOOL_DEFINITIONS = [
     {
@@ -19,6 +20,8 @@ TOOL_DEFINITIONS = [
 ]
 
 
+# Stub results depend only on the query, so repeat searches reuse the encoded JSON
+@lru_cache(maxsize=512)
 def _search_news(query: str) -> str:
     articles = [
         {
@@ -37,5 +40,6 @@ def _search_news(query: str) -> str:
 
 def execute_tool(name: str, args: dict) -> str:
     if name == "search_news":
-        return _search_news(args.get("query", ""))
+        # The query comes straight from the model; the cache needs a hashable str
+        return _search_news(str(args.get("query", "")))
     return json.dumps({"error": f"Unknown tool: {name}"})
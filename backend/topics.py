@@ -1,24 +1,40 @@
 """Predefined conversation topics loaded from shared JSON."""
 
-import json
+import sys
 from pathlib import Path
+from types import MappingProxyType
+
+import orjson
 
 _JSON_PATH = Path(__file__).resolve().parent.parent / "shared" / "topics.json"
 
-with open(_JSON_PATH, encoding="utf-8") as _f:
-    _ALL_TOPICS = json.load(_f)
 
-# Backend doesn't need the icon field
-TOPICS = [{k: v for k, v in t.items() if k != "icon"} for t in _ALL_TOPICS]
+def _load_topics() -> tuple[tuple[MappingProxyType, ...], MappingProxyType]:
+    """Parse shared/topics.json once into the topic list and an id index.
+
+    Built in one pass; backend doesn't need the icon field. Every topic (its
+    values are all strings) and the index are read-only views, so callers can
+    share them without copying.
+    """
+    topics = []
+    by_id = {}
+    for t in orjson.loads(_JSON_PATH.read_bytes()):
+        fields = {k: v for k, v in t.items() if k != "icon"}
+        fields["id"] = sys.intern(fields["id"])
+        topic = MappingProxyType(fields)
+        topics.append(topic)
+        by_id[topic["id"]] = topic
+    return tuple(topics), MappingProxyType(by_id)
+
 
-_TOPICS_BY_ID = {t["id"]: t for t in TOPICS}
+TOPICS, _TOPICS_BY_ID = _load_topics()
 
 
-def get_topics() -> list[dict]:
+def get_topics() -> tuple[MappingProxyType, ...]:
     """Return all available topics."""
     return TOPICS
 
 
-def get_topic_by_id(topic_id: str) -> dict | None:
+def get_topic_by_id(topic_id: str) -> MappingProxyType | None:
     """Look up a topic by ID. Returns None if not found."""
     return _TOPICS_BY_ID.get(topic_id)